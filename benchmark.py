@@ -0,0 +1,371 @@
+"""benchmark.py
+Benchmarks for gitdata's fetch, projection, sort, output and cache hot paths.
+
+API calls are made against a local stand-in for the GitHub REST API, which
+serves synthetic paginated orgs/repos/members/commits with Link and rate-limit
+headers, so results are reproducible and don't consume any GitHub rate limit.
+Results are written as JSON, for tracking regressions from release to release:
+
+c:\\> python benchmark.py -nbench_results.json
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+import gitdata as gd
+
+def bench(name, func, repeat): #---------------------------------------------<<<
+    """Time a benchmark function.
+
+    name   = name of the benchmark (as reported in the results)
+    func   = function to be timed; returns the number of records processed
+    repeat = number of times to run the function
+
+    Returns a dictionary of timing results for this benchmark.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = default_timer()
+        records = func()
+        timings.append(default_timer() - start)
+
+    return {'name': name, 'records': records, 'repeat': repeat,
+            'min': round(min(timings), 6),
+            'median': round(statistics.median(timings), 6),
+            'mean': round(statistics.mean(timings), 6)}
+
+def bench_cache(nrecords, repeat): #-----------------------------------------<<<
+    """Benchmark cache writes (cache_update) and reads (github_data_from_cache).
+    """
+    payload = synthetic_repos('benchorg', nrecords)
+    endpoint = '/orgs/benchorg/repos?per_page=100'
+
+    def cache_write():
+        gd.cache_update(endpoint, payload, {})
+        return len(payload)
+
+    def cache_read():
+        return len(gd.github_data_from_cache(endpoint=endpoint))
+
+    return [bench('cache_update', cache_write, repeat),
+            bench('github_data_from_cache', cache_read, repeat)]
+
+def bench_fetch(server_url, repeat): #---------------------------------------<<<
+    """Benchmark github_data() end-to-end against the stand-in API server.
+    """
+    gd._settings.api_url = server_url
+    gd._settings.datasource = 'a'
+
+    def fetch(endpoint, entity, constants):
+        return lambda: len(gd.github_data(endpoint=endpoint, entity=entity,
+                                          fields=None, constants=constants,
+                                          headers={}))
+
+    results = []
+    for entity, endpoint, constants in [
+            ('org', '/user/orgs', {'user': 'benchuser'}),
+            ('repo', '/orgs/benchorg/repos?per_page=100', {}),
+            ('member', '/orgs/benchorg/members?per_page=100', {'org': 'benchorg'}),
+            ('commit', '/repos/benchorg/benchrepo/commits?per_page=100',
+             {'owner': 'benchorg', 'repo': 'benchrepo'})]:
+        calls_before = gd._settings.tot_api_calls
+        result = bench('github_data[' + entity + ']',
+                       fetch(endpoint, entity, constants), repeat)
+        result['api_calls'] = (gd._settings.tot_api_calls - calls_before) // repeat
+        results.append(result)
+    return results
+
+def bench_projection(nrecords, repeat): #------------------------------------<<<
+    """Benchmark data_fields() and nested_json_value() over synthetic repos.
+    """
+    payload = synthetic_repos('benchorg', nrecords)
+
+    def project(fields):
+        return lambda: len([gd.data_fields(entity='repo', jsondata=item,
+                                           fields=fields, constants={})
+                            for item in payload])
+
+    def nested():
+        for item in payload:
+            gd.nested_json_value(item, 'owner.login')
+        return len(payload)
+
+    return [bench('data_fields[default]', project(None), repeat),
+            bench('data_fields[nested]', project(['name', 'owner.login',
+                                                  'license.name', 'private']),
+                  repeat),
+            bench('data_fields[*]', project(['*']), repeat),
+            bench('data_fields[nourls]', project(['nourls']), repeat),
+            bench('nested_json_value', nested, repeat)]
+
+def bench_sort(nrecords, repeat): #------------------------------------------<<<
+    """Benchmark data_sort() plus sorting of projected records.
+    """
+    payload = synthetic_repos('benchorg', nrecords)
+    random.Random(0).shuffle(payload)
+    projected = [gd.data_fields(entity='repo', jsondata=item,
+                                fields=None, constants={}) for item in payload]
+
+    def datasort():
+        for item in projected:
+            gd.data_sort(item)
+        return len(projected)
+
+    def sort():
+        return len(sorted(projected, key=gd.data_sort))
+
+    return [bench('data_sort', datasort, repeat),
+            bench('sorted[data_sort]', sort, repeat)]
+
+def bench_write(nrecords, repeat, folder): #---------------------------------<<<
+    """Benchmark data_write() for CSV and JSON output files.
+    """
+    payload = synthetic_repos('benchorg', nrecords)
+    projected = [gd.data_fields(entity='repo', jsondata=item,
+                                fields=['name', 'owner.login', 'id', 'private',
+                                        'created_at', 'language'],
+                                constants={}) for item in payload]
+
+    def write(filename):
+        def write_file():
+            with contextlib.redirect_stdout(io.StringIO()):
+                gd.data_write(filename, projected) # suppress status message
+            return len(projected)
+        return write_file
+
+    return [bench('data_write[csv]',
+                  write(os.path.join(folder, 'bench.csv')), repeat),
+            bench('data_write[json]',
+                  write(os.path.join(folder, 'bench.json')), repeat)]
+
+class BenchHandler(BaseHTTPRequestHandler): #--------------------------------<<<
+    """Request handler for the stand-in GitHub API server.
+
+    Serves pages of the synthetic datasets in server.datasets, which is a
+    dictionary of endpoint paths and the list of records they return.
+    """
+    def do_GET(self): # pylint: disable=C0103
+        """Return one page of data, with Link and rate-limit headers.
+        """
+        url = urlparse(self.path)
+        records = self.server.datasets.get(url.path)
+        if records is None:
+            self.send_error(404)
+            return
+
+        params = parse_qs(url.query)
+        per_page = min(int(params.get('per_page', ['30'])[0]), 100)
+        page = max(int(params.get('page', ['1'])[0]), 1)
+        lastpage = max((len(records) + per_page - 1) // per_page, 1)
+        body = json.dumps(records[(page - 1)*per_page:page*per_page]).encode()
+
+        links = []
+        root = 'http://%s:%s%s?per_page=%s&page=' % \
+            (self.server.server_address[0], self.server.server_address[1],
+             url.path, per_page)
+        if page < lastpage:
+            links.append('<' + root + str(page + 1) + '>; rel="next"')
+            links.append('<' + root + str(lastpage) + '>; rel="last"')
+        if page > 1:
+            links.append('<' + root + '1>; rel="first"')
+            links.append('<' + root + str(page - 1) + '>; rel="prev"')
+
+        with self.server.lock:
+            self.server.remaining = max(self.server.remaining - 1, 0)
+            remaining = self.server.remaining
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Limit', '5000')
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        if links:
+            self.send_header('Link', ', '.join(links))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        """Suppress the default request logging to stderr.
+        """
+        pass
+
+def bench_server(nrecords): #------------------------------------------------<<<
+    """Start the stand-in GitHub API server in a background thread.
+
+    nrecords = number of repos/members/commits served by each endpoint
+
+    Returns the server object; its URL is in the server_url attribute.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BenchHandler)
+    server.lock = threading.Lock()
+    server.remaining = 5000
+    server.datasets = {
+        '/user/orgs': [{'login': 'benchorg' + str(orgno), 'id': orgno,
+                        'url': 'https://api.github.com/orgs/benchorg' + str(orgno),
+                        'description': 'Synthetic org ' + str(orgno)}
+                       for orgno in range(50)],
+        '/orgs/benchorg/repos': synthetic_repos('benchorg', nrecords),
+        '/orgs/benchorg/members': synthetic_members(nrecords),
+        '/repos/benchorg/benchrepo/commits': synthetic_commits(nrecords)}
+    server.server_url = 'http://127.0.0.1:' + str(server.server_address[1])
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def synthetic_commits(nrecords): #-------------------------------------------<<<
+    """Generate a list of synthetic commit records, in GitHub API format.
+    """
+    rand = random.Random(nrecords)
+    commits = []
+    for commitno in range(nrecords):
+        sha = '%040x' % rand.getrandbits(160)
+        login = 'user' + str(rand.randrange(500))
+        date = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                             time.gmtime(1500000000 - commitno*3600))
+        person = {'login': login, 'id': rand.randrange(10**7), 'type': 'User',
+                  'url': 'https://api.github.com/users/' + login,
+                  'site_admin': False}
+        commits.append({
+            'sha': sha,
+            'url': 'https://api.github.com/repos/benchorg/benchrepo/commits/' + sha,
+            'html_url': 'https://github.com/benchorg/benchrepo/commit/' + sha,
+            'commit': {
+                'author': {'name': login, 'email': login + '@example.com',
+                           'date': date},
+                'committer': {'name': login, 'email': login + '@example.com',
+                              'date': date},
+                'message': 'Synthetic commit number ' + str(commitno),
+                'tree': {'sha': sha, 'url': 'https://api.github.com/trees/' + sha},
+                'comment_count': 0},
+            'author': person,
+            'committer': person,
+            'parents': [{'sha': sha, 'url': 'https://api.github.com/commits/' + sha}]})
+    return commits
+
+def synthetic_members(nrecords): #-------------------------------------------<<<
+    """Generate a list of synthetic member records, in GitHub API format.
+    """
+    members = []
+    for memberno in range(nrecords):
+        login = 'member' + str(memberno)
+        member = {'login': login, 'id': 1000000 + memberno, 'type': 'User',
+                  'site_admin': memberno % 97 == 0, 'gravatar_id': ''}
+        for urltype in ['avatar', 'html', 'followers', 'following', 'gists',
+                        'starred', 'subscriptions', 'organizations', 'repos',
+                        'events', 'received_events']:
+            member[urltype + '_url'] = \
+                'https://api.github.com/users/' + login + '/' + urltype
+        member['url'] = 'https://api.github.com/users/' + login
+        members.append(member)
+    return members
+
+def synthetic_repos(org, nrecords): #----------------------------------------<<<
+    """Generate a list of synthetic repo records, in GitHub API format.
+    """
+    rand = random.Random(nrecords)
+    languages = ['Python', 'C#', 'JavaScript', 'TypeScript', 'Go', 'C++', None]
+    licenses = [None, {'key': 'mit', 'name': 'MIT License', 'featured': True,
+                       'url': 'https://api.github.com/licenses/mit'}]
+    owner = {'login': org, 'id': 6154722, 'type': 'Organization',
+             'site_admin': False, 'url': 'https://api.github.com/orgs/' + org}
+    repos = []
+    for repono in range(nrecords):
+        name = 'repo-%06d' % repono
+        created = 1300000000 + rand.randrange(200000000)
+        repo = {
+            'id': 10000000 + repono, 'name': name, 'full_name': org + '/' + name,
+            'owner': owner, 'private': rand.random() < 0.2,
+            'fork': rand.random() < 0.1,
+            'description': 'Synthetic repo number ' + str(repono),
+            'language': rand.choice(languages),
+            'license': rand.choice(licenses),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                        time.gmtime(created)),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                        time.gmtime(created + 86400)),
+            'pushed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                       time.gmtime(created + 3600)),
+            'size': rand.randrange(100000),
+            'stargazers_count': rand.randrange(5000),
+            'watchers_count': rand.randrange(5000),
+            'forks_count': rand.randrange(500),
+            'open_issues_count': rand.randrange(200),
+            'has_issues': True, 'has_wiki': True, 'has_pages': False,
+            'default_branch': 'master',
+            'permissions': {'admin': False, 'push': True, 'pull': True}}
+        for urltype in ['html', 'forks', 'keys', 'collaborators', 'teams',
+                        'hooks', 'issue_events', 'events', 'assignees',
+                        'branches', 'tags', 'blobs', 'git_tags', 'git_refs',
+                        'trees', 'statuses', 'languages', 'stargazers',
+                        'contributors', 'subscribers', 'subscription',
+                        'commits', 'git_commits', 'comments', 'issue_comment',
+                        'contents', 'compare', 'merges', 'archive', 'downloads',
+                        'issues', 'pulls', 'milestones', 'notifications',
+                        'labels', 'releases', 'deployments', 'git', 'ssh',
+                        'clone', 'svn']:
+            repo[urltype + '_url'] = 'https://api.github.com/repos/' + \
+                org + '/' + name + '/' + urltype
+        repo['url'] = 'https://api.github.com/repos/' + org + '/' + name
+        repos.append(repo)
+    return repos
+
+@click.command()
+@click.option('-r', '--records', default=100000,
+              help='records for projection/sort/output benchmarks', metavar='<int>')
+@click.option('-p', '--pages', default=20,
+              help='pages (of 100) served per API endpoint', metavar='<int>')
+@click.option('-x', '--repeat', default=3,
+              help='times to run each benchmark', metavar='<int>')
+@click.option('-n', '--filename', default='',
+              help='JSON results filename (default = console)', metavar='<str>')
+def main(records, pages, repeat, filename): #--------------------------------<<<
+    """Run the gitdata benchmarks and write the results as JSON.
+    """
+    tempfolder = tempfile.mkdtemp(prefix='gitdata-bench-')
+    gd._settings.cache_folder = tempfolder
+    gd._settings.display_data = False
+    gd._settings.verbose = False
+    gd.auth_config({'username': ''})
+
+    server = bench_server(pages*100)
+    try:
+        results = bench_fetch(server.server_url, repeat)
+        results.extend(bench_projection(records, repeat))
+        results.extend(bench_sort(records, repeat))
+        results.extend(bench_write(records, repeat, tempfolder))
+        results.extend(bench_cache(records, repeat))
+    finally:
+        server.shutdown()
+        shutil.rmtree(tempfolder, ignore_errors=True)
+
+    output = json.dumps({
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'records': records, 'pages': pages, 'repeat': repeat},
+        'results': results}, indent=4)
+
+    if filename:
+        with open(filename, 'w') as fhandle:
+            fhandle.write(output + '\n')
+        click.echo('Benchmark results written: ' + filename)
+    else:
+        click.echo(output)
+
+if __name__ == '__main__':
+    main() # pylint: disable=E1120
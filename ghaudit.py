@@ -5,17 +5,117 @@ import configparser
 import gzip
 import json
 import os
+import sqlite3
 import sys
 
 import gitdata as gd
 
+# repo permissions, from lowest to highest
+PERMISSIONS = ['pull', 'push', 'admin']
+
+def accessmatrix(): #--------------------------------------------------------<<<
+    """Returns the effective-access model for all users and repos.
+
+    Joins teammembers.csv and repoteams.csv (team access) with collabs.csv
+    (repo-level collaborator access) to determine the highest permission
+    each user has for each repo. The model is a sparse matrix stored as two
+    dictionaries, with the same entries:
+    byuser = key = lowercase username, value = dict of repo -> permission
+    byrepo = key = lowercase org/repo, value = dict of username -> permission
+    Also included: orgmembers = dict of org -> set of lowercase usernames,
+    and outsidecollabs = dict of org -> set of lowercase usernames of the
+    org's outside collaborators (the org-level rows of collabs.csv, which have
+    no repo or permission; their repo access is in the repo-level rows).
+
+    The model is built once, and then cached in gd._settings.accessmatrix.
+    """
+    if hasattr(gd._settings, 'accessmatrix'):
+        return gd._settings.accessmatrix
+
+    # team id -> set of members
+    teammembers = dict()
+    with open('ghaudit/teammembers.csv', 'r') as fhandle:
+        next(fhandle) # skip the header row
+        for line in fhandle:
+            teamid, login = line.split(',')[:2]
+            teammembers.setdefault(teamid, set()).add(login.lower())
+
+    byuser = dict()
+    byrepo = dict()
+
+    def grant(login, repo, permission):
+        """Add a permission to the matrix, if higher than the existing one.
+        """
+        repo = repo.lower()
+        current = byuser.setdefault(login, dict()).get(repo)
+        if current is None or \
+            PERMISSIONS.index(permission) > PERMISSIONS.index(current):
+            byuser[login][repo] = permission
+            byrepo.setdefault(repo, dict())[login] = permission
+
+    # join each team's repo permissions with its members
+    with open('ghaudit/repoteams.csv', 'r') as fhandle:
+        next(fhandle) # skip the header row
+        for line in fhandle:
+            orgname, reponame, teamid, admin, push, pull = \
+                line.strip().split(',')[:6]
+            permission = repopermission(admin, push, pull)
+            if not permission:
+                continue
+            for login in teammembers.get(teamid, ()):
+                grant(login, orgname + '/' + reponame, permission)
+
+    # repo-level collaborators, and org-level outside collaborators
+    outsidecollabs = dict()
+    with open('ghaudit/collabs.csv', 'r') as fhandle:
+        next(fhandle) # skip the header row
+        for line in fhandle:
+            values = line.strip().split(',')
+            if len(values) < 3:
+                continue
+            if not values[1]:
+                outsidecollabs.setdefault(values[0].lower(), set()).add(
+                    values[2].lower())
+            elif len(values) > 3 and values[3]:
+                grant(values[2].lower(), values[0] + '/' + values[1], values[3])
+
+    orgmembers = dict()
+    with open('ghaudit/orgmembers.csv', 'r') as fhandle:
+        next(fhandle) # skip the header row
+        for line in fhandle:
+            orgname, login = line.split(',')[:2]
+            orgmembers.setdefault(orgname.lower(), set()).add(login.lower())
+
+    gd._settings.accessmatrix = {'byuser': byuser, 'byrepo': byrepo,
+                                 'orgmembers': orgmembers,
+                                 'outsidecollabs': outsidecollabs}
+    return gd._settings.accessmatrix
+
+def accessrepos(username, permission='pull'): #------------------------------<<<
+    """Return sorted list of (repo, permission) tuples for the repos that a
+    user has at least the specified permission for.
+    """
+    minimum = PERMISSIONS.index(permission)
+    repos = accessmatrix()['byuser'].get(username.lower(), dict())
+    return sorted((repo, perm) for repo, perm in repos.items()
+                  if PERMISSIONS.index(perm) >= minimum)
+
+def accessusers(repo, permission='pull'): #----------------------------------<<<
+    """Return sorted list of usernames that have at least the specified
+    permission for a repo (org/repo).
+    """
+    minimum = PERMISSIONS.index(permission)
+    users = accessmatrix()['byrepo'].get(repo.lower(), dict())
+    return sorted(login for login, perm in users.items()
+                  if PERMISSIONS.index(perm) >= minimum)
+
 def appendcollabs_org(filename, org=None): #---------------------------------<<<
     """Append collaborator info for an org to collabs.csv data file.
 
     Special case: if no org provided, initialize the data file.
     """
     if not org:
-        open(filename, 'w').write('org,repo,collaborator\n')
+        open(filename, 'w').write('org,repo,collaborator,permission\n')
         return
 
     headers_dict = {"Accept": "application/vnd.github.korra-preview"}
@@ -24,7 +124,7 @@ def appendcollabs_org(filename, org=None): #---------------------------------<<<
         filename=None, entity='collab', authuser='msftgits', \
         fields=['*'], headers=headers_dict)
     for collab in collabdata:
-        line = org + ',,' + collab['login']
+        line = org + ',,' + collab['login'] + ','
         open(filename, 'a').write(line + '\n')
 
 def appendcollabs_repo(filename, org, repo): #-------------------------------<<<
@@ -36,9 +136,12 @@ def appendcollabs_repo(filename, org, repo): #-------------------------------<<<
     endpoint = '/repos/' + org + '/' + repo + '/collaborators?per_page=100&affiliation=outside'
     collabdata = gdwrapper(endpoint=endpoint, \
         filename=None, entity='collab', authuser='msftgits', \
-        fields=['login', 'repo', 'id'], headers=headers_dict)
+        fields=['login', 'repo', 'id', 'permissions.admin', 'permissions.push', \
+                'permissions.pull'], headers=headers_dict)
     for collab in collabdata:
-        line = org + ',' + repo + ',' + collab['login']
+        line = org + ',' + repo + ',' + collab['login'] + ',' + \
+            repopermission(collab['permissions_admin'], collab['permissions_push'],
+                           collab['permissions_pull'])
         open(filename, 'a').write(line + '\n')
 
 def appendorgmembers(filename, org=None): #----------------------------------<<<
@@ -167,6 +270,10 @@ def audituser(username): #---------------------------------------------------<<<
         else:
             print('org:  ' + collab)
 
+    print('EFFECTIVE repo access:'.ljust(80, '-'))
+    for repo, permission in accessrepos(username):
+        print(permission.ljust(6) + repo)
+
     #/// for each repo: last update, readme, contributing, license, code of conduct
 
 def authenticate(): #--------------------------------------------------------<<<
@@ -252,7 +359,12 @@ def collaborations(username): #----------------------------------------------<<<
 def gdwrapper(*, endpoint, filename, entity, authuser, #---------------------<<<
               fields, headers, verbose=True):
     """gitdata wrapper for automating gitdata calls
+
+    Data for an endpoint is kept in memory (see gd.memo_config), so repeated
+    requests for the same endpoint don't read the cache or call the API.
     """
+    if gd._settings.memo is None:
+        gd.memo_config()
     gd._settings.display_data = False
     gd._settings.verbose = False
     gd._settings.datasource = 'a'
@@ -260,7 +372,7 @@ def gdwrapper(*, endpoint, filename, entity, authuser, #---------------------<<<
     templist = gd.github_data(
         endpoint=endpoint, entity=entity, fields=fields,
         constants={"user": authuser}, headers=headers)
-    sorted_data = sorted(templist, key=gd.data_sort)
+    sorted_data = gd.sort_records(templist)
     gd.data_display(sorted_data)
     gd.data_write(filename, sorted_data)
 
@@ -277,15 +389,12 @@ def islinked(username): #----------------------------------------------------<<<
     """Returns True if passed GitHub username is a linked Microsoft account.
     """
     if not hasattr(gd._settings, 'linked'):
-        gd._settings.linked = []
-        firstline = True
-        for line in open('ghaudit/linkdata.csv', 'r').readlines():
-            if firstline:
-                firstline = False
-                continue
-            gd._settings.linked.append(line.split(',')[0].lower())
+        connection = linkindex()
+        gd._settings.linked = \
+            set(login for (login,) in connection.execute('SELECT login FROM links'))
+        connection.close()
 
-    return (username.lower() in gd._settings.linked)
+    return username.lower() in gd._settings.linked
 
 def latestlinkdata(): #------------------------------------------------------<<<
     """Returns the most recent filename for Azure blobs that contain linkdata.
@@ -306,19 +415,47 @@ def linkedemail(username): #-------------------------------------------------<<<
     """Returned linked email address (if any) for specified GitHub username.
     """
     if not hasattr(gd._settings, 'linkedemail'):
-        gd._settings.linkedemail = dict()
-        firstline = True
-        for line in open('ghaudit/linkdata.csv', 'r').readlines():
-            if firstline:
-                firstline = False
-                continue
-            gd._settings.linkedemail[line.split(',')[0].lower()] = line.split(',')[1].strip()
+        gd._settings.linkedemail = linkindex()
+
+    row = gd._settings.linkedemail.execute(
+        'SELECT email FROM links WHERE login = ?', (username.lower(),)).fetchone()
+    return row[0] if row else None
 
-    return gd._settings.linkedemail.get(username.lower(), None)
+def linkindex(): #-----------------------------------------------------------<<<
+    """Returns a connection to the linking data index, ghaudit/linkdata.db.
+
+    The index is a SQLite database with one row per linked GitHub account,
+    keyed by lowercase GitHub username. If it doesn't exist yet, or
+    ghaudit/linkdata.csv has been modified since it was built, it is
+    (re)built from ghaudit/linkdata.csv.
+    """
+    dbname = 'ghaudit/linkdata.db'
+    csvname = 'ghaudit/linkdata.csv'
+    if not os.path.isfile(dbname) or \
+        os.path.getmtime(csvname) > os.path.getmtime(dbname):
+        with open(csvname, 'r') as fhandle:
+            next(fhandle) # skip the header row
+            writelinkindex(dbname, (line.rstrip('\n').split(',')[:2]
+                                    for line in fhandle))
+    return sqlite3.connect(dbname)
 
 def orgmemberships(username): #----------------------------------------------<<<
     """Return list of orgs that user is member of.
+
+    If the cached members data for every org in orgs.csv is available for the
+    authenticated user (see authenticate()), looks up the user in each org's
+    cache file via its offset index (see gd.cache_lookup). Otherwise, scans
+    orgmembers.csv.
     """
+    with open('ghaudit/orgs.csv', 'r') as fhandle:
+        next(fhandle) # skip the header row
+        orgnames = [line.split(',')[0] for line in fhandle]
+    endpoints = ['/orgs/' + orgname + '/members?per_page=100'
+                 for orgname in orgnames]
+    if orgnames and all(gd.cache_exists(endpoint) for endpoint in endpoints):
+        return [orgname for orgname, endpoint in zip(orgnames, endpoints)
+                if gd.cache_lookup(endpoint, login=username)]
+
     orgs = []
     firstline = True
     for line in open('ghaudit/orgmembers.csv', 'r').readlines():
@@ -331,12 +468,32 @@ def orgmemberships(username): #----------------------------------------------<<<
             orgs.append(orgname)
     return orgs
 
+def outsideadmins(): #-------------------------------------------------------<<<
+    """Return sorted list of (username, repo) tuples for outside collaborators
+    (users who aren't members of the repo's org) with admin permission.
+    """
+    matrix = accessmatrix()
+    return sorted((login, repo)
+                  for repo, users in matrix['byrepo'].items()
+                  for login, permission in users.items()
+                  if permission == 'admin' and
+                  login not in matrix['orgmembers'].get(repo.split('/')[0], ()))
+
 def printhdr(acct, msg): #---------------------------------------------------<<<
     """Print a header for a section of the audit report.
     """
     ndashes = 65 - len(msg)
     print('>> ' + msg + ' <<' + ndashes*'-' + ' account: ' + acct.upper())
 
+def repopermission(admin, push, pull): #-------------------------------------<<<
+    """Return the highest permission (admin, push or pull) from the values of
+    the admin/push/pull permissions returned by the GitHub API, or '' if none.
+    """
+    for permission, value in [('admin', admin), ('push', push), ('pull', pull)]:
+        if str(value) == 'True':
+            return permission
+    return ''
+
 def teamdesc(teamid): #------------------------------------------------------<<<
     """Return a 1-liner description for specified team id.
     """
@@ -403,14 +560,25 @@ def updatelinkdata(): #------------------------------------------------------<<<
     block_blob_service = BlockBlobService(account_name=azure_acct, account_key=azure_key)
     block_blob_service.get_blob_to_path(azure_container, azure_blobname, gzfile)
 
-    # decompress the JSON file and write to linkdata.csv
+    # decompress the JSON file one line at a time, and write each linked
+    # account to linkdata.csv and the linkdata.db index
     outfile = 'ghaudit/linkdata.csv'
-    with open(outfile, 'w') as fhandle:
+    with open(outfile, 'w') as fhandle, \
+        gzip.open(gzfile, 'rt', encoding='utf-8') as gzhandle:
         fhandle.write('githubuser,email\n')
-        for line in gzip.open(gzfile).readlines():
-            jsondata = json.loads(line.decode('utf-8'))
-            outline = jsondata['ghu'] + ',' + jsondata['aadupn']
-            fhandle.write(outline + '\n')
+
+        def links():
+            """Generator that yields (githubuser, email) for each linked account.
+            """
+            for line in gzhandle:
+                jsondata = json.loads(line)
+                fhandle.write(jsondata['ghu'] + ',' + jsondata['aadupn'] + '\n')
+                yield jsondata['ghu'], jsondata['aadupn']
+            # finish writing linkdata.csv before the index, so that the
+            # index isn't older than the CSV file (see linkindex)
+            fhandle.flush()
+
+        writelinkindex('ghaudit/linkdata.db', links())
 
 def updatemsdata(): #--------------------------------------------------------<<<
     """Retrieve/refresh all Microsoft data needed for audit reports.
@@ -423,6 +591,9 @@ def updatemsdata(): #--------------------------------------------------------<<<
     omembersfile = 'ghaudit/orgmembers.csv'
     repoteamsfile = 'ghaudit/repoteams.csv'
 
+    # Prometheus textfile, updated as each endpoint is retrieved
+    gd.metrics_config(filename='ghaudit/gitdata.prom')
+
     # these variables control which data files are generated (for testing, etc.)
     write_orgs = False
     write_teams = False
@@ -515,6 +686,26 @@ def userrepos(acct): #-------------------------------------------------------<<<
         reponame = repo['name']
         print(owner + '/' + reponame)
 
+def writelinkindex(dbname, links): #-----------------------------------------<<<
+    """Write the linking data index (see linkindex()).
+
+    dbname = filename of the SQLite database
+    links = iterable of (githubuser, email) tuples
+
+    The index is written to a temporary file and then renamed, so that an
+    existing index remains usable until the new one is complete.
+    """
+    tempname = dbname + '.tmp'
+    if os.path.isfile(tempname):
+        os.remove(tempname)
+    connection = sqlite3.connect(tempname)
+    connection.execute('CREATE TABLE links (login TEXT PRIMARY KEY, email TEXT)')
+    connection.executemany('INSERT OR REPLACE INTO links VALUES (?, ?)',
+                           ((githubuser.lower(), email) for githubuser, email in links))
+    connection.commit()
+    connection.close()
+    os.replace(tempname, dbname)
+
 if __name__ == '__main__':
     sys.stdout = open(sys.stdout.fileno(), mode='w', encoding='utf8', buffering=1)
     #updatemsdata()
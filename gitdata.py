@@ -4,19 +4,79 @@ Entry point:
 cli() --------------------> Handle command-line arguments.
 """
 import collections
+import collections.abc
 import configparser
+import contextlib
+import csv
+import datetime
+import glob
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import mmap
+import operator
 import os
+import pickle
+import re
+import shlex
+import sqlite3
 import sys
+import tempfile
+import threading
 import time
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from timeit import default_timer
+from urllib.parse import parse_qs, urlparse
 
 import click
+import requests
 
 from dougerino import dicts2csv, dicts2json, setting, time_stamp, logcalls
-from githuberino import github_allpages
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
+
+# fields included in the offset index of each cache file (see cache_lookup)
+CACHE_KEYNAMES = ['id', 'login', 'name', 'sha']
+
+# seconds before a sidecar or temporary file without a cache file is treated
+# as orphaned (until then, it may belong to a cache write in progress)
+CACHE_ORPHANAGE = 3600
+
+# suffixes of the files/folders stored next to a cache file (filename without
+# the .json extension + suffix), which are removed along with the cache file
+CACHE_SIDECARS = ['.json.lock', '.columns', '.snapshots', '.offsets.db']
+
+# approximate number of pages of commits in each since/until time window
+# retrieved by commitspartitioned(), and the maximum number of windows
+COMMITS_WINDOW = 10
+COMMITS_MAXWINDOWS = 500
+
+# number of lines written to the console at a time by data_display()
+DISPLAY_CHUNK = 1000
+
+# minimum size (bytes) of the part of a cache file handled by each worker
+# process in export_jobs()
+EXPORT_CHUNK = 4 * 1024 * 1024
+
+# maximum seconds to wait for another thread's fetch of the same endpoint
+# (see inflight_wait) before calling the API without it
+INFLIGHT_TIMEOUT = 60
+
+# upper bounds of the Prometheus histogram buckets for API request latency
+METRICS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf')]
+
+# date/time values in ISO 8601 format, which are sorted as dates by sort_key()
+SORT_ISODATE = re.compile(r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?' +
+                          r'(Z|[+-]\d{2}:\d{2})?)?$')
+
+# maximum size (bytes) of the usage log; when it's exceeded, usage_record()
+# removes old entries (see usage_prune)
+USAGE_MAXSIZE = 1024 * 1024
+
 @click.group(context_settings=CONTEXT_SETTINGS, options_metavar='[options]',
              invoke_without_command=True)
 @click.option('-a', '--auth', default='',
@@ -37,6 +97,9 @@ syntax help: gitdata <subcommand> -h"""
         auth_status(auth.lower(), token, delete)
         return
 
+    # repeated requests for the same endpoint in this run use in-memory data
+    memo_config()
+
     # note that all subcommands are invoked by the Click framework decorators,
     # so nothing to do here.
 
@@ -51,11 +114,16 @@ class _settings: #-----------------------------------------------------------<<<
 
     datasource = 'p' # a=API, c=cache, p=prompt user to select
 
+    api_url = 'https://api.github.com' # root URL for GitHub REST API calls
+    cache_folder = None # None = gh_cache subfolder of the gitdata module
+
     # current session object from requests library
     requests_session = None
 
     verbose = False # whether to display status information on console
     display_data = True # whether to display retrieved data on console
+    display_limit = 0 # max records to display (0 = no limit)
+    display_pager = False # whether to display data through a pager
 
     # initialize gitdata session settings
     start_time = time.time() # session start time (seconds)
@@ -63,9 +131,24 @@ class _settings: #-----------------------------------------------------------<<<
     tot_api_bytes = 0 # total bytes returned by these API calls
     last_ratelimit = 0 # API rate limit for the most recent API call
     last_remaining = 0 # remaining portion of rate limit after last API call
+    totals_lock = threading.Lock() # for updating the totals from threads
+
+    request_hooks = [] # functions called for each trace event (trace_addhook)
+    metrics = None # metric values collected by metrics_hook(), if enabled
+    metrics_file = '' # Prometheus textfile updated by metrics_hook()
 
     unknownfieldname = set() # list of unknown field names encountered
 
+    sort_memory = 256 * 1024 * 1024 # bytes to sort in memory (sort_records)
+    snapshot_keep = 0 # snapshots kept per endpoint for diff (0 = none)
+
+    memo = None # in-memory LRU cache of endpoint data (see memo_config)
+
+    # endpoint fetches in progress, shared with concurrent callers
+    inflight = dict() # key = memo_key(), value = dict for the fetch
+    inflight_lock = threading.Lock()
+    tot_coalesced = 0 # number of fetches that waited for another caller
+
 def auth_config(settings=None): #--------------------------------------------<<<
     """Configure authentication settings.
 
@@ -126,57 +209,592 @@ def auth_status(auth, token, delete): #--------------------------------------<<<
     click.echo('  Username: ' + auth)
     click.echo('     Token: ' + token_abbr(setting('github', auth, 'pat')))
 
-def auth_user(): #-----------------------------------------------------------<<<
+def auth_user(state=None): #-------------------------------------------------<<<
     """Credentials for basic authentication.
 
+    state = settings object (default _settings)
+
     Returns the tuple used for API calls, based on current settings.
     Returns None if no GitHub username/PAT is currently set.
     <internal>
     """
-    if _settings.username:
-        return (_settings.username, _settings.accesstoken)
+    if not state:
+        state = _settings
+    if state.username:
+        return (state.username, state.accesstoken)
 
     return None
 
-def cache_exists(endpoint, auth=None): #-------------------------------------<<<
+@cli.group(help='Manage the local cache of GitHub data')
+def cache(): #---------------------------------------------------------------<<<
+    """Cache management commands.
+    """
+    pass # subcommands are invoked by the Click framework decorators
+
+def cache_entries(state=None): #---------------------------------------------<<<
+    """Get information about the files in the cache folder.
+
+    state = settings object (default _settings)
+
+    Returns a tuple (entries, orphans). entries is a dictionary with a key for
+    each cache file and a value that is a dictionary of these values: size
+    (bytes, including sidecars), mtime, atime (last access; at least mtime)
+    and sidecars (list of sidecar paths). orphans is a list of sidecars and
+    temporary files that don't belong to a cache file and haven't been
+    modified in the last CACHE_ORPHANAGE seconds. Lock files are never
+    orphans, because another process may be waiting for a lock.
+    <internal>
+    """
+    entries = dict()
+    others = dict() # key = path, value = (owner cache filename, size, mtime)
+
+    root = cache_root(state)
+    folders = [root]
+    if os.path.isdir(root):
+        folders.extend(entry.path for entry in os.scandir(root)
+                       if entry.is_dir() and len(entry.name) == 2)
+
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if entry.name.endswith('.json') and entry.is_file():
+                stat = entry.stat()
+                entries[entry.path] = {
+                    'size': stat.st_size, 'mtime': stat.st_mtime,
+                    'atime': max(stat.st_atime, stat.st_mtime), 'sidecars': []}
+                continue
+            owner = None
+            for suffix in CACHE_SIDECARS:
+                if entry.name.endswith(suffix):
+                    owner = os.path.join(
+                        folder, entry.name[:-len(suffix)] + '.json')
+            if owner is None and not entry.name.endswith('.tmp'):
+                continue # not a cache file, sidecar or temporary file
+            if owner not in entries and entry.name.endswith('.json.lock'):
+                continue # lock files are left in place (see cache_remove)
+            if entry.is_dir():
+                size = sum(subentry.stat().st_size for subentry
+                           in os.scandir(entry.path) if subentry.is_file())
+            else:
+                size = entry.stat().st_size
+            others[entry.path] = (owner, size, entry.stat().st_mtime)
+
+    orphans = []
+    cutoff = time.time() - CACHE_ORPHANAGE
+    for path, (owner, size, mtime) in others.items():
+        if owner in entries:
+            entries[owner]['size'] += size
+            entries[owner]['sidecars'].append(path)
+        elif mtime < cutoff:
+            orphans.append(path)
+
+    return (entries, sorted(orphans))
+
+@cache.command(name='evict', help='Remove least recently used cache files '
+               'to fit a size quota')
+@click.option('-m', '--maxsize', required=True,
+              help='maximum total size (e.g., 500M or 2G)', metavar='<str>')
+@click.option('--dryrun', is_flag=True, default=False,
+              help='list the files to be removed, without removing them')
+def cache_evict(maxsize, dryrun): #------------------------------------------<<<
+    """Remove the least recently used cache files until the cache fits in
+    the specified size.
+    """
+    quota = size_bytes(maxsize)
+    if quota is None:
+        click.echo('ERROR: invalid size: ' + maxsize)
+        return
+
+    entries, _ = cache_entries()
+    total = sum(entry['size'] for entry in entries.values())
+    removed = []
+    for filename in sorted(entries, key=lambda fname: entries[fname]['atime']):
+        if total <= quota:
+            break
+        total -= entries[filename]['size']
+        removed.append(filename)
+
+    cache_remove(removed, entries, dryrun)
+
+def cache_exists(endpoint, auth=None, state=None): #-------------------------<<<
     """Check whether cached data exists for an endpoint.
 
     endpoint = GitHub REST API endpoint
     auth = GitHub authentication username
+    state = settings object (default _settings)
+
+    Returns True if local cached data exists (in its shard, or in the
+    unsharded layout used by earlier versions), False if not.
+    """
+    return os.path.isfile(cache_filename(endpoint, auth, state))
+
+def cache_glob(endpoint, auth=None, state=None): #---------------------------<<<
+    """Get cache filenames for an endpoint that may contain * wildcards.
+
+    endpoint = GitHub REST API endpoint (e.g., '/orgs/*/repos')
+    auth = GitHub authentication username
+    state = settings object (default _settings)
 
-    Returns True if local cached data exists, False if not.
+    Returns a sorted list of the matching cache filenames, in all shards and
+    in the unsharded layout used by earlier versions.
     """
-    return os.path.isfile(cache_filename(endpoint, auth))
+    nameonly = os.path.basename(cache_filename(endpoint, auth, state))
+    root = cache_root(state)
+    return sorted(glob.glob(os.path.join(root, '??', nameonly)) +
+                  glob.glob(os.path.join(root, nameonly)))
 
-def cache_filename(endpoint, auth=None): #-----------------------------------<<<
+def cache_filename(endpoint, auth=None, state=None, #------------------------<<<
+                   forwrite=False):
     """Get cache filename for specified user/endpoint.
 
     endpoint = the endpoint at https://api.github.com (starts with /)
     auth = authentication username
-
-    Returns the filename for caching data returned from this API call.
+    state = settings object (default _settings)
+    forwrite = whether the filename is for writing the cache file
+
+    Returns the filename for caching data returned from this API call. Cache
+    files are stored in 256 subfolders (shards) of the cache folder, named
+    for the first two hex digits of the MD5 hash of the filename. Unless
+    forwrite is set, the filename in the unsharded layout used by earlier
+    versions is returned if only that file exists (see cache_migrate).
     """
+    if not state:
+        state = _settings
     if not auth:
-        auth = _settings.username if _settings.username else '_anon'
+        auth = state.username if state.username else '_anon'
 
-    source_folder = os.path.dirname(os.path.realpath(__file__))
     filename = auth + '_' + endpoint.replace('/', '-').strip('-')
     if '?' in filename:
         # remove parameters from the endpoint
         filename = filename[:filename.find('?')]
+    filename += '.json'
+
+    shard = hashlib.md5(filename.encode('utf-8')).hexdigest()[:2]
+    sharded = os.path.join(cache_root(state), shard, filename)
+    if not forwrite and not os.path.isfile(sharded):
+        unsharded = os.path.join(cache_root(state), filename)
+        if os.path.isfile(unsharded):
+            return unsharded
+    return sharded
+
+def cache_index(filename, offsets): #----------------------------------------<<<
+    """Write the offset index for a cache file.
+
+    filename = the cache filename
+    offsets  = list of (record, offset, length) tuples for the records in the
+               cache file
+
+    The index is a SQLite database (<cache file>.offsets.db) that maps each
+    record's id, login, name and sha values (stored with the key name, so
+    that an id of 7 and a name of '7' are different keys) to the record's
+    offset and length in the cache file, so that cache_lookup() can read
+    only the matching records. Keys are matched without regard to case. The
+    cache file's size and modification time are stored in the index, to
+    detect an index that is out of date.
+    <internal>
+    """
+    dbname = os.path.splitext(filename)[0] + '.offsets.db'
+    tempname = dbname + '.' + str(os.getpid()) + '.tmp'
+    remove_path(tempname)
+    stat = os.stat(filename)
+    connection = sqlite3.connect(tempname)
+    try:
+        connection.execute('CREATE TABLE meta (size INTEGER, mtime INTEGER)')
+        connection.execute('INSERT INTO meta VALUES (?, ?)',
+                           (stat.st_size, stat.st_mtime_ns))
+        connection.execute('CREATE TABLE offsets (keyname TEXT, '
+                           'key TEXT COLLATE NOCASE, offset INTEGER, '
+                           'length INTEGER)')
+        connection.executemany(
+            'INSERT INTO offsets VALUES (?, ?, ?, ?)',
+            ((keyname, str(record[keyname]), offset, length)
+             for record, offset, length in offsets
+             if isinstance(record, dict)
+             for keyname in CACHE_KEYNAMES
+             if record.get(keyname) is not None))
+        connection.execute('CREATE INDEX offsets_key ON offsets '
+                           '(keyname, key)')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tempname, dbname)
+
+@contextlib.contextmanager
+def cache_lock(filename): #--------------------------------------------------<<<
+    """Context manager that holds an exclusive lock on a cache file.
+
+    filename = the cache filename
+
+    Uses an advisory lock on a .lock file next to the cache file (fcntl on
+    Linux/macOS, msvcrt on Windows), so that concurrent gitdata processes
+    sharing a cache folder update each cache file one at a time.
+    <internal>
+    """
+    fhandle = open(filename + '.lock', 'a+')
+    if os.name == 'nt':
+        import msvcrt
+        fhandle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fhandle.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                pass # LK_LOCK gives up after 10 seconds, so keep trying
+    else:
+        import fcntl
+        fcntl.flock(fhandle.fileno(), fcntl.LOCK_EX)
+
+    try:
+        yield
+    finally:
+        if os.name == 'nt':
+            fhandle.seek(0)
+            msvcrt.locking(fhandle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(fhandle.fileno(), fcntl.LOCK_UN)
+        fhandle.close()
+
+def cache_lookup(endpoint, auth=None, state=None, **key): #------------------<<<
+    """Get the records with a key value from the cached data for an endpoint.
+
+    endpoint = GitHub REST API endpoint
+    auth     = GitHub authentication username
+    state    = settings object (default _settings)
+    key      = one keyword argument: the record's id, login, name or sha
+               (e.g., name='gitdata' for an org's repos endpoint)
+
+    Uses the cache file's offset index to parse only the requested records
+    from the memory-mapped cache file. The index is built by the first lookup
+    after the cache file is written (see cache_lookupfile). Keys are matched
+    without regard to case, as GitHub does for logins and names.
+
+    Returns a list of the matching records (dictionaries), in cache file
+    order. This is usually one record, but a key can match more than one
+    (e.g., repos with the same name in different orgs, in /user/repos data).
+    Returns an empty list if there are none.
+    """
+    if len(key) != 1 or not set(key) <= set(CACHE_KEYNAMES):
+        raise ValueError('cache_lookup() requires one of these keyword '
+                         'arguments: ' + ', '.join(CACHE_KEYNAMES))
+    if not cache_exists(endpoint, auth, state):
+        return []
+    keyname, value = key.popitem()
+    return cache_lookupfile(cache_filename(endpoint, auth, state),
+                            keyname, value)
+
+def cache_lookupfile(filename, keyname, value): #----------------------------<<<
+    """Get the records with a key value from a cache file, using its offset
+    index.
+
+    filename = the cache filename
+    keyname  = 'id', 'login', 'name' or 'sha'
+    value    = the key value to look up
+
+    If the index is missing or out of date (the cache file has been written
+    since it was built), it's rebuilt first. A cache file that isn't in the
+    cache_save() format (e.g., written by an earlier version of gitdata) is
+    rewritten in that format before it's indexed.
+
+    Returns a list of the matching records. See cache_lookup().
+    <internal>
+    """
+    dbname = os.path.splitext(filename)[0] + '.offsets.db'
+
+    for _ in range(2):
+        with open(filename, 'rb') as fhandle:
+            stat = os.fstat(fhandle.fileno())
+            try:
+                connection = sqlite3.connect('file:' + dbname + '?mode=ro',
+                                             uri=True)
+                try:
+                    current = connection.execute(
+                        'SELECT size, mtime FROM meta').fetchone() == \
+                        (stat.st_size, stat.st_mtime_ns)
+                    locations = connection.execute(
+                        'SELECT offset, length FROM offsets '
+                        'WHERE keyname = ? AND key = ? ORDER BY offset',
+                        (keyname, str(value))).fetchall()
+                finally:
+                    connection.close()
+            except sqlite3.Error:
+                current = False # no index for this cache file
+
+            if current:
+                if not locations:
+                    return []
+                with mmap.mmap(fhandle.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mapped:
+                    return [json.loads(mapped[offset:offset + length])
+                            for offset, length in locations]
+
+        # the index is missing or out of date, so rebuild it
+        with cache_lock(filename):
+            offsets = cache_offsets(filename)
+            if offsets is None:
+                cache_save(filename, read_json(filename))
+                offsets = cache_offsets(filename)
+            cache_index(filename, offsets)
+
+    return []
+
+@cache.command(name='migrate', help='Move cache files into the sharded '
+               'folder layout')
+def cache_migrate(): #-------------------------------------------------------<<<
+    """Move cache files written by earlier versions of gitdata from the top
+    level of the cache folder into their shards.
+    """
+    root = cache_root()
+    moved = 0
+    if os.path.isdir(root):
+        for entry in os.scandir(root):
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            shard = hashlib.md5(entry.name.encode('utf-8')).hexdigest()[:2]
+            os.makedirs(os.path.join(root, shard), exist_ok=True)
+            os.replace(entry.path, os.path.join(root, shard, entry.name))
+            moved += 1
+
+    click.echo('Cache files moved: ', nl=False)
+    click.echo(click.style(str(moved), fg='cyan'))
+
+def cache_offsets(filename): #-----------------------------------------------<<<
+    """Get the offsets of the records in a cache file, for cache_index().
+
+    filename = the cache filename
+
+    Returns a list of (record, offset, length) tuples, or None if the cache
+    file isn't in the cache_save() format (one record per line).
+    <internal>
+    """
+    offsets = []
+    with open(filename, 'rb') as fhandle:
+        firstline = fhandle.readline()
+        if firstline.rstrip() != b'[':
+            return None
+        offset = len(firstline)
+        for line in fhandle:
+            record = line.rstrip().rstrip(b',')
+            if record not in [b'', b']']:
+                try:
+                    offsets.append((json.loads(record), offset, len(record)))
+                except ValueError:
+                    return None # not cache_save() format
+            offset += len(line)
+    return offsets
+
+@cache.command(name='prune', help='Remove cache files older than a number '
+               'of days')
+@click.option('--days', required=True, type=int,
+              help='remove cache files last updated before this many days ago',
+              metavar='<int>')
+@click.option('--dryrun', is_flag=True, default=False,
+              help='list the files to be removed, without removing them')
+def cache_prune(days, dryrun): #---------------------------------------------<<<
+    """Remove cache files (and their sidecars) that are older than the
+    specified number of days, and orphaned sidecars/temporary files.
+    """
+    cutoff = time.time() - days * 86400
+    entries, orphans = cache_entries()
+    removed = [filename for filename in sorted(entries)
+               if entries[filename]['mtime'] < cutoff]
+    cache_remove(removed, entries, dryrun, orphans)
+
+def cache_records(filename, fields): #---------------------------------------<<<
+    """Generator that yields the records in a cache file, one at a time, with
+    only the data needed for the specified fields.
+
+    filename = the cache filename
+    fields   = list of field names, which may include dot-notation references
+               to nested values (e.g., 'owner.login')
+
+    Each record is decoded separately, and nested dictionaries (owner,
+    license, permissions, etc.) and other values that aren't referenced by
+    the field names are discarded before the next record is read, so memory
+    use depends on the number of fields rather than the size of the cache
+    file. Cache files written by cache_save() have one record per line; cache
+    files in other formats are parsed incrementally if the ijson package is
+    installed, or otherwise read in full.
+    <internal>
+    """
+    # tree of the referenced names; an empty dictionary = all nested values
+    tree = dict()
+    for fldname in fields:
+        node = tree
+        for key in fldname.split('.'):
+            if key in node and not node[key]:
+                break # the entire value is already referenced
+            node = node.setdefault(key, dict())
+        else:
+            node.clear()
+
+    def pruned(value, node):
+        """Get the referenced parts of a value.
+        """
+        if not node or not isinstance(value, dict):
+            return value
+        return {key: pruned(value[key], node[key])
+                for key in node if key in value}
+
+    with open(filename, 'rb') as fhandle:
+        if fhandle.readline().rstrip() == b'[':
+            # cache_save() format, one record per line
+            for recno, line in enumerate(fhandle):
+                line = line.rstrip().rstrip(b',')
+                if line == b']':
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if recno:
+                        raise
+                    break # not cache_save() format
+                yield pruned(record, tree)
 
-    return os.path.join(source_folder, 'gh_cache/' + filename + '.json')
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        if ijson:
+            fhandle.seek(0)
+            for record in ijson.items(fhandle, 'item', use_float=True):
+                yield pruned(record, tree)
+            return
+
+    for record in read_json(filename):
+        yield pruned(record, tree)
+
+def cache_remove(filenames, entries, dryrun=False, orphans=None): #----------<<<
+    """Remove cache files and their sidecars.
+
+    filenames = list of cache filenames to be removed
+    entries   = dictionary returned by cache_entries()
+    dryrun    = whether to only list the files, without removing them
+    orphans   = list of orphaned sidecars/temporary files to be removed
+
+    Displays the number of files and bytes removed.
+    <internal>
+    """
+    orphans = orphans if orphans else []
+    nbytes = 0
+    for filename in filenames:
+        nbytes += entries[filename]['size']
+        if dryrun:
+            click.echo(filename)
+            continue
+        with cache_lock(filename):
+            os.remove(filename)
+            for sidecar in entries[filename]['sidecars']:
+                if not sidecar.endswith('.json.lock'):
+                    remove_path(sidecar)
+        # the .lock file isn't removed, because another process may be
+        # waiting for a lock on it (see cache_lock)
+
+    for orphan in orphans:
+        if dryrun:
+            click.echo(orphan)
+        else:
+            remove_path(orphan)
+
+    click.echo('Cache files ' + ('to be removed: ' if dryrun else 'removed: '),
+               nl=False)
+    click.echo(click.style(str(len(filenames)) + ' ({:,} bytes)'.format(nbytes),
+                           fg='cyan'))
+    if orphans:
+        click.echo('Orphaned files: ', nl=False)
+        click.echo(click.style(str(len(orphans)), fg='cyan'))
+
+def cache_root(state=None): #------------------------------------------------<<<
+    """Get the cache folder.
+
+    state = settings object (default _settings)
+
+    Returns state.cache_folder, or the gh_cache subfolder of the gitdata
+    module if no cache folder is set.
+    <internal>
+    """
+    if not state:
+        state = _settings
+    if state.cache_folder:
+        return state.cache_folder
+    source_folder = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(source_folder, 'gh_cache')
+
+def cache_save(filename, payload): #-----------------------------------------<<<
+    """Write a cache file. The caller must hold the cache file's lock (see
+    cache_lock()).
 
-def cache_update(endpoint, payload, constants): #----------------------------<<<
+    filename = the cache filename
+    payload  = list of dictionaries to be cached
+
+    The cache file is a JSON array with one record per line, written to a
+    temporary file and then renamed, so that readers never see a partially
+    written cache file. The temporary file has a unique name, and is created
+    with the same permissions as a file created with open() (0666 less the
+    process's umask, applied when the file is created). The offset index
+    isn't written until it's needed (see cache_lookupfile).
+    <internal>
+    """
+    while True:
+        tempname = filename + '.' + os.urandom(4).hex() + '.tmp'
+        try:
+            handle = os.open(tempname, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                             getattr(os, 'O_BINARY', 0), 0o666)
+            break
+        except FileExistsError:
+            continue # another writer's temporary file
+    try:
+        with os.fdopen(handle, 'wb') as fhandle:
+            fhandle.write(b'[')
+            for recno, record in enumerate(payload):
+                fhandle.write(b',\n' if recno else b'\n')
+                fhandle.write(json.dumps(record).encode('utf-8'))
+            fhandle.write(b'\n]\n')
+        os.replace(tempname, filename)
+    except BaseException:
+        remove_path(tempname)
+        raise
+
+@cache.command(name='stats', help='Display cache statistics')
+def cache_stats(): #---------------------------------------------------------<<<
+    """Display the number, total size and age range of the cache files.
+    """
+    entries, orphans = cache_entries()
+    values = [('Cache folder', cache_root()),
+              ('Cache files', str(len(entries))),
+              ('Sidecars', str(sum(len(entry['sidecars'])
+                                   for entry in entries.values()))),
+              ('Orphaned files', str(len(orphans))),
+              ('Total size', '{:,} bytes'.format(
+                  sum(entry['size'] for entry in entries.values())))]
+    if entries:
+        mtimes = [entry['mtime'] for entry in entries.values()]
+        values.append(('Oldest update', time.strftime(
+            '%Y-%m-%d %H:%M:%S', time.localtime(min(mtimes)))))
+        values.append(('Newest update', time.strftime(
+            '%Y-%m-%d %H:%M:%S', time.localtime(max(mtimes)))))
+
+    for label, value in values:
+        click.echo(label.rjust(15) + ': ', nl=False)
+        click.echo(click.style(value, fg='cyan'))
+
+def cache_update(endpoint, payload, constants, state=None): #----------------<<<
     """Update cached data.
 
     endpoint  = the API endpoint (e.g., '/repos/org')
     payload   = the list of dictionaries returned from API endpoint
     constants = dictionary of fieldnames/values to be included in the
                 cached data (e.g., criteria used in the API call)
+    state     = settings object (default _settings)
 
-    Writes the cache file for this endpoint. Overwrites existing cached data.
+    Writes the cache file for this endpoint. Overwrites existing cached data,
+    and removes a cache file for the endpoint in the unsharded layout used by
+    earlier versions. The previous data isn't kept, so the diff command has
+    nothing to compare unless state.snapshot_keep is set (by the --snapshots
+    option), in which case a snapshot of the new data is also saved.
     """
+    if not state:
+        state = _settings
 
     if constants:
         # add the constants to the API payload
@@ -188,10 +806,18 @@ def cache_update(endpoint, payload, constants): #----------------------------<<<
     else:
         cached_data = payload # no constants to be added
 
-    filename = cache_filename(endpoint)
-    dicts2json(source=payload, filename=filename) # write cached data
-
-    if _settings.verbose:
+    filename = cache_filename(endpoint, state=state, forwrite=True)
+    start = default_timer()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with cache_lock(filename):
+        cache_save(filename, payload)
+        if state.snapshot_keep:
+            snapshot_write(filename, payload, state.snapshot_keep)
+    remove_path(os.path.join(cache_root(state), os.path.basename(filename)))
+    trace_event('cache_write', state=state, endpoint=endpoint.split('?')[0],
+                records=len(payload), seconds=default_timer() - start)
+
+    if state.verbose:
         nameonly = os.path.basename(filename)
         click.echo('Cache update: ', nl=False)
         click.echo(click.style(nameonly, fg='cyan'))
@@ -208,17 +834,33 @@ def cache_update(endpoint, payload, constants): #----------------------------<<<
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+@click.option('--count', is_flag=True, default=False,
+              help='display the number of collaborators instead of retrieving them')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
 def collabs(owner, repo, audit2fa, authuser, source, #-----------------------<<<
-            filename, fields, display, verbose, listfields):
+            filename, fields, display, verbose, trace, metrics,
+            snapshots, sort, displaylimit, pager, count, listfields):
     """Get collaborator information for a repo.
     """
     if listfields:
@@ -236,13 +878,26 @@ def collabs(owner, repo, audit2fa, authuser, source, #-----------------------<<<
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
     source = source if source else 'p'
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
     fldnames = fields.split('/') if fields else None
+    if count:
+        data_counts([({'owner': owner, 'repo': repo},
+                      endpoint_spec('collab', owner=owner, repo=repo,
+                                    audit2fa=audit2fa))], filename)
+        elapsed_time(start_time)
+        return
     endpoint = '/repos/' + owner + '/' + repo + '/collaborators?per_page=100' + \
         ('&filter=2fa_disabled' if audit2fa else '')
     templist = github_data(
@@ -250,7 +905,7 @@ def collabs(owner, repo, audit2fa, authuser, source, #-----------------------<<<
         fields=fldnames, constants={"owner": owner, "repo": repo}, headers={})
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
@@ -260,24 +915,56 @@ def collabs(owner, repo, audit2fa, authuser, source, #-----------------------<<<
 @click.option('-o', '--owner', default='',
               help='owner (org or user)', metavar='<str>')
 @click.option('-r', '--repo', default='',
-              help='repo name', metavar='<str>')
+              help='repo name (* = all repos of the org, with each repo\'s '
+              'commits cached as soon as they\'re retrieved)', metavar='<str>')
+@click.option('-w', '--workers', default=8,
+              help='repos (-r *) or time windows (--partition) retrieved '
+              'concurrently', metavar='<int>')
+@click.option('--partition', is_flag=True, default=False,
+              help='retrieve a repo\'s history in concurrent time windows')
 @click.option('-a', '--authuser', default='',
               help='authentication username', metavar='<str>')
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+@click.option('--count', is_flag=True, default=False,
+              help='display the number of commits instead of retrieving them')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
-def commits(owner, repo, authuser, source, filename, fields, #---------------<<<
-            display, verbose, listfields):
+def commits(owner, repo, workers, partition, authuser, source, #-------------<<<
+            filename, fields, display, verbose, trace, metrics,
+            snapshots, sort, displaylimit, pager, count, listfields):
     """Get commits for a repo.
+
+    If repo is *, gets commits for all repos of the org, retrieving up to
+    <workers> repos at a time, and each repo's commits are cached as soon as
+    they've been retrieved. Unless --sort is specified or the commits are
+    both displayed and written to an output file, the commits are displayed
+    or written as each repo's commits are retrieved.
+
+    If --partition is specified, the repo's history is retrieved from the
+    API in since/until time windows, up to <workers> windows at a time (see
+    commitspartitioned()).
     """
     if listfields:
         list_fields('commit') # display online help
@@ -287,6 +974,9 @@ def commits(owner, repo, authuser, source, filename, fields, #---------------<<<
     if not owner or not repo:
         click.echo('ERROR: must specify owner and repo')
         return
+    if partition and repo == '*':
+        click.echo('ERROR: --partition can\'t be used with -r *')
+        return
     if not filename_valid(filename):
         return
 
@@ -294,27 +984,216 @@ def commits(owner, repo, authuser, source, filename, fields, #---------------<<<
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
-    source = source if source else 'p'
+    source = 'a' if partition else (source if source else 'p')
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
     fldnames = fields.split('/') if fields else None
+    if count:
+        repolist = sorted(repodata['name'] for repodata
+                          in reposget(org=owner, fields=['name'])) \
+            if repo == '*' else [repo]
+        data_counts([({'owner': owner, 'repo': reponame},
+                      endpoint_spec('commit', owner=owner, repo=reponame))
+                     for reponame in repolist], filename)
+        elapsed_time(start_time)
+        return
+    if partition:
+        templist = commitspartitioned(owner=owner, repo=repo, fields=fldnames,
+                                      workers=workers)
+        sorted_data = sort_records(templist, sort)
+        data_display(sorted_data)
+        data_write(filename, sorted_data)
+        elapsed_time(start_time)
+        return
+    if repo == '*':
+        if _settings.datasource not in ['a', 'c']:
+            # prompt once for all repos
+            _settings.datasource = click.prompt(
+                'Read from API (a), cache (c) or exit (x)?').lower()[:1]
+            if _settings.datasource not in ['a', 'c']:
+                return
+        session_config(poolsize=max(workers, 10))
+        repolist = sorted(repodata['name'] for repodata
+                          in reposget(org=owner, fields=['name']))
+        records = commitsdata(owner=owner, repos=repolist, workers=workers,
+                              fields=fldnames if fldnames else
+                              default_fields('commit') + ['repo'])
+        if sort:
+            records = sort_records(records, sort)
+        elif filename and display:
+            records = list(records) # displayed and then written
+        data_display(records)
+        data_write(filename, records)
+        elapsed_time(start_time)
+        return
+
     endpoint = '/repos/' + owner + '/' + repo + '/commits?per_page=100'
     templist = github_data(
         endpoint=endpoint, entity='commit',
         fields=fldnames, constants={"owner": owner, "repo": repo}, headers={})
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
     elapsed_time(start_time)
 
+def commitsdata(*, owner=None, repos=None, fields=None, #--------------------<<<
+                workers=8):
+    """Generator that retrieves commits for multiple repos concurrently.
+
+    owner   = owner of the repos (org or user)
+    repos   = list of repo names
+    fields  = list of fields to be returned
+    workers = maximum number of repos retrieved at the same time
+
+    Each repo's commits are retrieved (and cached) by github_data() in a
+    worker thread, and yielded as soon as that repo is complete, so the order
+    of the repos is not predictable. Each worker thread has its own requests
+    session (see ThreadSettings). If _settings.datasource is 'c', repos that
+    have no cached commits are skipped.
+    """
+    specs = [endpoint_spec('commit', owner=owner, repo=repo) for repo in repos]
+    if _settings.datasource == 'c':
+        specs = [spec for spec in specs if cache_exists(spec['endpoint'])]
+
+    threadlocal = threading.local()
+    def repo_commits(spec):
+        """Get one repo's commits, in a worker thread.
+        """
+        if not hasattr(threadlocal, 'state'):
+            threadlocal.state = ThreadSettings(_settings)
+        return github_data(fields=fields, state=threadlocal.state, **spec)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(repo_commits, spec) for spec in specs]
+        for future in as_completed(futures):
+            yield from future.result()
+
+def commitspartitioned(*, owner=None, repo=None, fields=None, #--------------<<<
+                       workers=8):
+    """Get the commits for a repo, retrieving time windows of the repo's
+    history concurrently.
+
+    owner   = owner of the repo (org or user)
+    repo    = repo name
+    fields  = list of fields to be returned
+    workers = maximum number of time windows retrieved at the same time
+
+    The first page of commits is used as a probe: if there are more pages,
+    the repo's history (from the oldest commit, found on the last page, to
+    the newest commit) is split into since/until windows sized so that each
+    window has about COMMITS_WINDOW pages at the commit rate of the first
+    page. If the API doesn't return a last page link, the repo's creation
+    date is used in place of the oldest commit; the oldest and newest windows
+    are open-ended, so commits dated before that (e.g., imported history) are
+    still included. The commits are merged in the order of the windows
+    (newest first) and deduplicated by sha, and the cache file is updated
+    with the merged commits.
+
+    Returns a list of dictionaries containing the specified fields.
+    """
+    spec = endpoint_spec('commit', owner=owner, repo=repo)
+    auth = auth_user()
+    session_config(poolsize=max(workers, 10))
+
+    response = github_api(endpoint=spec['endpoint'], auth=auth,
+                          headers=spec['headers'])
+    if not response.ok:
+        click.echo('ERROR: HTTP ' + str(response.status_code) +
+                   ' returned for ' + spec['endpoint'])
+        return []
+    payload = response.json()
+
+    def commit_time(commit):
+        """Get the timestamp (seconds) of a commit's committer date.
+        """
+        return datetime.datetime.strptime(
+            commit['commit']['committer']['date'],
+            '%Y-%m-%dT%H:%M:%SZ').replace(
+                tzinfo=datetime.timezone.utc).timestamp()
+
+    def iso_time(timestamp):
+        """Get the ISO 8601 format of a timestamp, for since/until values.
+        """
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+    if 'next' in response.links:
+        newest = commit_time(payload[0])
+        oldest = None
+        if 'last' in response.links:
+            # the last page ends with the oldest commit
+            lastpage = github_api(endpoint=response.links['last']['url'],
+                                  auth=auth, headers=spec['headers'])
+            if lastpage.ok and lastpage.json():
+                oldest = commit_time(lastpage.json()[-1])
+        if oldest is None:
+            repoendpoint = '/repos/' + owner + '/' + repo
+            repodata = github_api(endpoint=repoendpoint, auth=auth, headers={})
+            if not repodata.ok:
+                click.echo('ERROR: HTTP ' + str(repodata.status_code) +
+                           ' returned for ' + repoendpoint)
+                return []
+            oldest = datetime.datetime.strptime(
+                repodata.json()['created_at'], '%Y-%m-%dT%H:%M:%SZ').replace(
+                    tzinfo=datetime.timezone.utc).timestamp()
+
+        # size the windows from the time span of the first page of commits
+        pagespan = max(newest - commit_time(payload[-1]), 1)
+        window = max(pagespan * COMMITS_WINDOW, 86400,
+                     (newest - oldest) / COMMITS_MAXWINDOWS)
+        edges = [] # since/until boundaries, from newest to oldest
+        while newest - window * (len(edges) + 1) > oldest:
+            edges.append(newest - window * (len(edges) + 1))
+        windows = [(since, until) for since, until
+                   in zip(edges + [None], [None] + edges)]
+
+        def window_commits(since_until):
+            """Get all commits in a time window.
+            """
+            since, until = since_until
+            endpoint = spec['endpoint'] + \
+                ('&since=' + iso_time(since) if since else '') + \
+                ('&until=' + iso_time(until) if until else '')
+            return github_allpages(endpoint=endpoint, auth=auth,
+                                   headers=spec['headers'])
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            results = executor.map(window_commits, windows)
+            payload = []
+            shas = set()
+            try:
+                for windowdata in results:
+                    for commit in windowdata:
+                        if commit['sha'] not in shas:
+                            shas.add(commit['sha'])
+                            payload.append(commit)
+            except IncompleteData:
+                return [] # error already displayed; don't cache partial data
+
+        if _settings.verbose:
+            click.echo('Time windows: ', nl=False)
+            click.echo(click.style(str(len(windows)), fg='cyan'))
+
+    usage_record(spec['endpoint'])
+    cache_update(spec['endpoint'], payload, spec['constants'])
+
+    return [data_fields(entity='commit', jsondata=commit, fields=fields)
+            for commit in payload]
+
 def data_fields(*, entity=None, jsondata=None, #-----------------------------<<<
-                fields=None, constants=None):
+                fields=None, constants=None, state=None):
     """Get dictionary of desired values from GitHub API JSON payload.
 
     entity   = entity type ('repo', 'member')
@@ -327,14 +1206,16 @@ def data_fields(*, entity=None, jsondata=None, #-----------------------------<<<
     constants = dictionary of fieldnames/values that can be included in the
                 specified fields but aren't returned by GitHub API (these are
                 typically criteria used in the API call)
+    state    = settings object where unknown field names are recorded
+               (default _settings)
 
-    Returns a dictionary of fieldnames/values.
+    Returns a Record (a compact read-only mapping) of fieldnames/values.
     """
 
     if not fields:
         fields = default_fields(entity)
 
-    values = collections.OrderedDict()
+    values = dict()
 
     if fields[0] in ['*', 'urls', 'nourls']:
         # special cases to return all fields or all url/non-url fields
@@ -361,25 +1242,91 @@ def data_fields(*, entity=None, jsondata=None, #-----------------------------<<<
                 values[fldname] = constants[fldname]
             else:
                 values[fldname.replace('.', '_')] = \
-                    nested_json_value(jsondata, fldname)
+                    nested_json_value(jsondata, fldname, state)
                 if fldname.lower() == 'private':
                     values[fldname] = \
                         'private' if jsondata[fldname] else 'public'
-    return values
+    return record_class(tuple(values))(values.values())
+
+def data_counts(targets, filename=None): #-----------------------------------<<<
+    """Display and/or write the number of records returned by endpoints.
+
+    targets  = list of (labels, spec) tuples, where labels is a dictionary of
+               fieldnames/values that identify the endpoint in the output
+               (e.g., {'org': 'octocat'}) and spec is a dictionary returned
+               by endpoint_spec()
+    filename = output filename (.CSV, .JSON or .JSONL), or None
+
+    Each count is a record with the labels plus a 'count' field (None if the
+    count couldn't be retrieved); see github_count(). If there is more than
+    one target, the total is also displayed.
+    """
+    records = []
+    for labels, spec in targets:
+        values = dict(labels)
+        values['count'] = github_count(endpoint=spec['endpoint'],
+                                       headers=spec['headers'])
+        records.append(record_class(tuple(values))(values.values()))
+
+    data_display(records)
+    data_write(filename, records)
+    if len(records) > 1 and _settings.display_data:
+        click.echo('Total: ', nl=False)
+        click.echo(click.style(str(sum(record['count'] or 0
+                                       for record in records)), fg='cyan'))
 
 def data_display(datasource=None): #-----------------------------------------<<<
     """Display data on console.
 
-    datasource   = list of dictionaries
+    datasource   = list (or other iterable) of dictionaries
 
-    If _settings.display_data, displays the data in console output
+    If _settings.display_data, displays the data in console output. Output is
+    written in chunks of DISPLAY_CHUNK lines, and only styled (colored) if
+    stdout is a terminal. _settings.display_limit limits the number of records
+    displayed, and _settings.display_pager displays through a pager.
     """
     if not _settings.display_data:
         return
 
-    for data_item in datasource:
-        values = [str(value) for _, value in data_item.items()]
-        click.echo(click.style(','.join(values), fg='cyan'))
+    start = default_timer()
+    if _settings.display_limit > 0:
+        datasource = iter(datasource)
+        limited = itertools.islice(datasource, _settings.display_limit)
+    else:
+        limited = datasource
+    styled = sys.stdout.isatty()
+    records = 0
+
+    def chunks():
+        """Generator that returns display lines in chunks.
+        """
+        nonlocal records
+        lines = []
+        for data_item in limited:
+            lines.append(','.join([str(value) for value in data_item.values()]))
+            if len(lines) == DISPLAY_CHUNK:
+                records += len(lines)
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        records += len(lines)
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    if _settings.display_pager:
+        click.echo_via_pager(chunks())
+    else:
+        for chunk in chunks():
+            click.echo(click.style(chunk, fg='cyan') if styled else chunk,
+                       nl=False)
+    trace_event('output', target='console', records=records,
+                seconds=default_timer() - start)
+
+    if _settings.verbose and _settings.display_limit > 0 and \
+        records == _settings.display_limit and \
+        next(datasource, None) is not None:
+        # records were left out
+        click.echo('Display limit: ', nl=False)
+        click.echo(click.style(str(records) + ' records', fg='cyan'))
 
     # List unknown field names encountered in this session (if any)
     try:
@@ -404,20 +1351,67 @@ def data_write(filename=None, datasource=None): #----------------------------<<<
     """Write output file.
 
     filename   = output filename
-    datasource = list of dictionaries
+    datasource = list (or other iterable) of dictionaries; if not a list, the
+                 records are written as they're read from the iterable
     """
     if not filename:
         return
 
     _, file_ext = os.path.splitext(filename)
 
-    if file_ext.lower() == '.json':
-        dicts2json(source=datasource, filename=filename) # write JSON file
+    start = default_timer()
+    if isinstance(datasource, list) and file_ext.lower() != '.jsonl' and \
+        not (datasource and isinstance(datasource[0], Record)):
+        records = len(datasource)
+        if file_ext.lower() == '.json':
+            dicts2json(source=datasource, filename=filename) # write JSON file
+        else:
+            dicts2csv(datasource, filename) # write CSV file
     else:
-        dicts2csv(datasource, filename) # write CSV file
+        records = data_write_stream(filename, datasource)
+    trace_event('output', target=filename, records=records,
+                seconds=default_timer() - start)
 
     click.echo('Output file written: ' + filename)
 
+def data_write_stream(filename, datasource): #-------------------------------<<<
+    """Write an output file one record at a time.
+
+    filename   = output filename (.CSV, .JSON or .JSONL)
+    datasource = iterable of dictionaries
+
+    .JSON and .CSV files have the same format as those written by dicts2json()
+    and dicts2csv(): JSON is indented 4 spaces with sorted keys, and CSV has a
+    header row of the first record's field names. .JSONL files have one
+    compact JSON object per line.
+
+    Returns the number of records written.
+    <internal>
+    """
+    _, file_ext = os.path.splitext(filename)
+    records = 0
+    with open(filename, 'w', newline='') as fhandle:
+        if file_ext.lower() == '.json':
+            for data_item in datasource:
+                itemtext = json.dumps(dict(data_item.items()), indent=4,
+                                      sort_keys=True)
+                fhandle.write((',\n' if records else '[\n') + '    ' +
+                              itemtext.replace('\n', '\n    '))
+                records += 1
+            fhandle.write('\n]' if records else '[]')
+        elif file_ext.lower() == '.jsonl':
+            for data_item in datasource:
+                fhandle.write(json.dumps(dict(data_item.items())) + '\n')
+                records += 1
+        else:
+            csvwriter = csv.writer(fhandle, dialect='excel')
+            for data_item in datasource:
+                if not records:
+                    csvwriter.writerow(list(data_item.keys())) # header row
+                csvwriter.writerow([value for _, value in data_item.items()])
+                records += 1
+    return records
+
 def default_fields(entity=None): #-------------------------------------------<<<
     """Get default field names for an entity.
 
@@ -439,6 +1433,133 @@ def default_fields(entity=None): #-------------------------------------------<<<
         return ['commit.committer.date', 'committer.login', 'commit.message']
     return ['name'] # if unknown entity type, use name
 
+@cli.command(help='Compare snapshots of cached data')
+@click.argument('entity', type=click.Choice(['collabs', 'commits', 'members',
+                                             'orgs', 'repos', 'teams']),
+                metavar='<entity>')
+@click.option('-o', '--org', default='',
+              help='org or owner', metavar='<str>')
+@click.option('-u', '--user', default='',
+              help='GitHub user (repos)', metavar='<str>')
+@click.option('-t', '--team', default='',
+              help='team ID (members)', metavar='<str>')
+@click.option('-r', '--repo', default='',
+              help='repo name (collabs/commits)', metavar='<str>')
+@click.option('-a', '--authuser', default='',
+              help='authentication username', metavar='<str>')
+@click.option('--old', default='',
+              help='older snapshot (default = second most recent)',
+              metavar='<str>')
+@click.option('--new', default='',
+              help='newer snapshot (default = most recent)', metavar='<str>')
+@click.option('--list', 'listsnapshots', is_flag=True, default=False,
+              help='list the available snapshots')
+@click.option('-n', '--filename', default='',
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
+@click.option('-f', '--fields', default='',
+              help='fields to compare and include', metavar='<str>')
+@click.option('-d', '--display', is_flag=True, default=True,
+              help="Don't display retrieved data")
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help="Display verbose status info")
+def diff(entity, org, user, team, repo, authuser, old, new, #----------------<<<
+         listsnapshots, filename, fields, display, verbose):
+    """Compare two snapshots of the cached data for an endpoint.
+
+    Snapshots are saved when the cache file is updated by a command run with
+    the --snapshots option (which sets how many are kept). Records are
+    matched by id (sha for commits), and each added, removed or changed
+    record is returned with a change column. A record is changed if any of
+    the specified fields differ.
+    """
+    if entity != 'orgs' and not (org or user or team):
+        click.echo('ERROR: must specify an org, user or team')
+        return
+    if entity in ['collabs', 'commits'] and not repo:
+        click.echo('ERROR: must specify owner and repo')
+        return
+    if not filename_valid(filename):
+        return
+
+    start_time = default_timer()
+    _settings.display_data = display
+    _settings.verbose = verbose
+    auth_config({'username': authuser})
+
+    spec = endpoint_spec(entity[:-1], org=org, user=user, team=team,
+                         owner=org, repo=repo, authname=authuser)
+    folder = os.path.splitext(cache_filename(spec['endpoint']))[0] + \
+        '.snapshots'
+    snapshots = snapshot_list(folder)
+    if listsnapshots:
+        for snapshot in snapshots:
+            click.echo(snapshot)
+        return
+
+    old = old if old else (snapshots[-2] if len(snapshots) > 1 else '')
+    new = new if new else (snapshots[-1] if snapshots else '')
+    if old not in snapshots or new not in snapshots:
+        click.echo('ERROR: snapshots not found (see --list)')
+        return
+    if verbose:
+        click.echo('   Snapshots: ', nl=False)
+        click.echo(click.style(old + ' -> ' + new, fg='cyan'))
+
+    fldnames = fields.split('/') if fields else default_fields(entity[:-1])
+    changes = list(diff_records(os.path.join(folder, old),
+                                os.path.join(folder, new),
+                                entity[:-1], fldnames, spec['constants']))
+
+    data_display(changes)
+    data_write(filename, changes)
+
+    elapsed_time(start_time)
+
+def diff_records(oldpath, newpath, entity, fields, constants=None): #--------<<<
+    """Generator that compares two snapshots and yields the differences.
+
+    oldpath   = path of the older snapshot, without the .jsonl/.idx extension
+    newpath   = path of the newer snapshot, without the .jsonl/.idx extension
+    entity    = entity type ('repo', 'member')
+    fields    = list of fields to compare and return
+    constants = dictionary of constant values, as for data_fields()
+
+    This is a hash join of the two snapshot indexes: only the records that
+    were added, removed or changed are read from the snapshot files. Yields a
+    dictionary for each difference, with a change column ('added', 'removed'
+    or 'changed'), followed by the specified fields (from the newer snapshot,
+    except for removed records).
+    """
+    with open(oldpath + '.idx', 'r') as fhandle:
+        oldindex = json.load(fhandle)
+    with open(newpath + '.idx', 'r') as fhandle:
+        newindex = json.load(fhandle)
+
+    with open(oldpath + '.jsonl', 'rb') as oldfile, \
+        open(newpath + '.jsonl', 'rb') as newfile:
+
+        def change(label, record):
+            """Get the output dictionary for a changed record.
+            """
+            values = collections.OrderedDict([('change', label)])
+            values.update(data_fields(entity=entity, jsondata=record,
+                                      fields=fields, constants=constants))
+            return values
+
+        for key, (hashval, offset, length) in newindex.items():
+            if key not in oldindex:
+                yield change('added', snapshot_read(newfile, offset, length))
+            elif hashval != oldindex[key][0]:
+                newrecord = change('changed',
+                                   snapshot_read(newfile, offset, length))
+                oldrecord = change('changed', snapshot_read(
+                    oldfile, oldindex[key][1], oldindex[key][2]))
+                if newrecord != oldrecord:
+                    yield newrecord
+        for key, (hashval, offset, length) in oldindex.items():
+            if key not in newindex:
+                yield change('removed', snapshot_read(oldfile, offset, length))
+
 def elapsed_time(starttime): #-----------------------------------------------<<<
     """Display elapsed time.
 
@@ -446,11 +1567,194 @@ def elapsed_time(starttime): #-----------------------------------------------<<<
 
     If _settings.verbose, displays elapsed time in seconds.
     """
+    elapsed = default_timer() - starttime
+    trace_event('elapsed', seconds=elapsed, api_calls=_settings.tot_api_calls,
+                api_bytes=_settings.tot_api_bytes)
+
     if _settings.verbose:
         click.echo('Elapsed time: ', nl=False)
-        elapsed = default_timer() - starttime
         click.echo(click.style("{0:.2f}".format(elapsed) + ' seconds', fg='cyan'))
 
+def endpoint_spec(entity, *, org=None, user=None, team=None, #---------------<<<
+                  owner=None, repo=None, authname=None,
+                  audit2fa=False, adminonly=False):
+    """Get the API call used to retrieve an entity type.
+
+    entity    = entity type ('collab', 'commit', 'member', 'org', 'repo' or
+                'team')
+    org       = organization name (member, repo or team)
+    user      = username (repo, if no org)
+    team      = team ID (member or repo, instead of org)
+    owner     = owner of the repo (collab or commit)
+    repo      = repo name (collab or commit)
+    authname  = authentication username (org)
+    audit2fa  = whether to only return members/collaborators with 2FA disabled
+    adminonly = whether to only return members with role=admin
+
+    Returns a dictionary of the endpoint, entity, constants and headers
+    arguments for github_data() or github_records().
+    """
+    headers = {}
+    if entity == 'collab':
+        endpoint = '/repos/' + owner + '/' + repo + \
+            '/collaborators?per_page=100' + \
+            ('&filter=2fa_disabled' if audit2fa else '')
+        constants = {"owner": owner, "repo": repo}
+    elif entity == 'commit':
+        endpoint = '/repos/' + owner + '/' + repo + '/commits?per_page=100'
+        constants = {"owner": owner, "repo": repo}
+    elif entity == 'member' and team:
+        endpoint = '/teams/' + str(team) + '/members?per_page=100'
+        constants = {"org": org}
+    elif entity == 'member':
+        endpoint = '/orgs/' + org + '/members?per_page=100' + \
+            ('&filter=2fa_disabled' if audit2fa else '') + \
+            ('&role=admin' if adminonly else '')
+        constants = {"org": org}
+    elif entity == 'org':
+        endpoint = '/user/orgs'
+        constants = {"user": authname}
+    elif entity == 'repo':
+        if team:
+            endpoint = '/teams/' + str(team) + '/repos?per_page=100'
+        elif org:
+            endpoint = '/orgs/' + org + '/repos?per_page=100'
+        else:
+            endpoint = '/users/' + user + '/repos?per_page=100'
+        # custom header to retrieve license info while License API is in preview
+        headers = {'Accept': 'application/vnd.github.drax-preview+json'}
+        constants = None
+    else: # team
+        endpoint = '/orgs/' + org + '/teams?per_page=100'
+        constants = {"org": org}
+
+    return {'endpoint': endpoint, 'entity': entity, 'constants': constants,
+            'headers': headers}
+
+def export_chunk(task): #----------------------------------------------------<<<
+    """Project and serialize part of a cache file. Runs in a worker process
+    started by export_jobs().
+
+    task = tuple (filename, start, end, entity, fields, constants, file_ext)
+           filename = the cache filename
+           start    = offset of the first line to read, or None to read all
+                      records in the cache file
+           end      = offset after the last line to read
+           file_ext = output file type ('.csv', '.json' or '.jsonl')
+           (see data_fields() for entity, fields and constants)
+
+    Returns a tuple (header, text, records, unknown field names), where header
+    is the list of field names of the first record and text is the serialized
+    records in the format of data_write_stream().
+    <internal>
+    """
+    filename, start, end, entity, fields, constants, file_ext = task
+    state = _settings
+
+    def chunk_records():
+        """Generator that yields the records in this part of the cache file.
+        """
+        if start is None:
+            yield from read_json(filename)
+            return
+        with open(filename, 'rb') as fhandle:
+            fhandle.seek(start)
+            while fhandle.tell() < end:
+                line = fhandle.readline().rstrip().rstrip(b',')
+                if line and line not in [b'[', b']']:
+                    yield json.loads(line)
+
+    header = None
+    records = 0
+    text = io.StringIO()
+    csvwriter = csv.writer(text, dialect='excel')
+    for json_item in chunk_records():
+        data_item = data_fields(entity=entity, jsondata=json_item,
+                                fields=fields, constants=constants,
+                                state=state)
+        if header is None:
+            header = list(data_item.keys())
+        if file_ext == '.csv':
+            csvwriter.writerow([value for _, value in data_item.items()])
+        elif file_ext == '.json':
+            itemtext = json.dumps(dict(data_item.items()), indent=4,
+                                  sort_keys=True)
+            text.write((',\n' if records else '') + '    ' +
+                       itemtext.replace('\n', '\n    '))
+        else:
+            text.write(json.dumps(dict(data_item.items())) + '\n')
+        records += 1
+
+    return header, text.getvalue(), records, state.unknownfieldname
+
+def export_jobs(filename, sources, fields, jobs): #--------------------------<<<
+    """Write cached data to an output file, using a pool of worker processes
+    to project and serialize the records.
+
+    filename = output filename (.CSV, .JSON or .JSONL)
+    sources  = list of dictionaries returned by endpoint_spec(), for the
+               cached data to be written
+    fields   = list of fields to be written (see data_fields())
+    jobs     = number of worker processes
+
+    Cache files written by cache_save() are split into parts of at least
+    EXPORT_CHUNK bytes, and each part is handled by one worker; cache files
+    in other formats are handled by a single worker. The results are written
+    to the output file in the order of the sources and of the records in each
+    cache file. Unlike the single-process output, the records are not sorted
+    by the first field.
+
+    Returns the number of records written.
+    """
+    file_ext = os.path.splitext(filename)[1].lower()
+    tasks = []
+    for source in sources:
+        if not cache_exists(source['endpoint']):
+            click.echo('ERROR: no cached data for ' + source['endpoint'])
+            continue
+        usage_record(source['endpoint'])
+        cachefile = cache_filename(source['endpoint'])
+        spec = (source['entity'], fields, source['constants'], file_ext)
+        filesize = os.path.getsize(cachefile)
+        with open(cachefile, 'rb') as fhandle:
+            lines = [fhandle.readline().rstrip(), fhandle.readline().rstrip()]
+            if lines[0] != b'[' or not lines[1].startswith((b'{', b']')):
+                tasks.append((cachefile, None, None) + spec) # not line format
+                continue
+            nparts = max(1, min(jobs * 4, filesize // EXPORT_CHUNK))
+            offsets = [len(lines[0]) + 1]
+            for part in range(1, nparts):
+                fhandle.seek(max(offsets[-1], filesize * part // nparts))
+                fhandle.readline() # move to the start of the next line
+                offsets.append(fhandle.tell())
+        offsets.append(filesize)
+        tasks.extend((cachefile, start, end) + spec
+                     for start, end in zip(offsets, offsets[1:])
+                     if start < end)
+
+    start_time = default_timer()
+    records = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor, \
+        open(filename, 'w', newline='') as fhandle:
+        for header, text, nrecords, unknown in executor.map(export_chunk,
+                                                            tasks):
+            _settings.unknownfieldname.update(unknown)
+            if not nrecords:
+                continue
+            if file_ext == '.csv' and not records:
+                csv.writer(fhandle, dialect='excel').writerow(header)
+            elif file_ext == '.json':
+                fhandle.write(',\n' if records else '[\n')
+            fhandle.write(text)
+            records += nrecords
+        if file_ext == '.json':
+            fhandle.write('\n]' if records else '[]')
+    trace_event('output', target=filename, records=records,
+                seconds=default_timer() - start_time)
+
+    click.echo('Output file written: ' + filename)
+    return records
+
 def filename_valid(filename=None): #-----------------------------------------<<<
     """Check filename for valid file type.
 
@@ -462,14 +1766,267 @@ def filename_valid(filename=None): #-----------------------------------------<<<
         return True # filename is optional
 
     _, file_ext = os.path.splitext(filename)
-    if file_ext.lower() not in ['.csv', '.json']:
-        click.echo('ERROR: output file must be .CSV or .JSON')
+    if file_ext.lower() not in ['.csv', '.json', '.jsonl']:
+        click.echo('ERROR: output file must be .CSV, .JSON or .JSONL')
         return False
 
     return True
 
+class GitData: #-------------------------------------------------------------<<<
+    """Client object for retrieving GitHub data from Python code.
+
+    Each GitData object has its own settings, requests session, cache folder,
+    trace hooks and API call totals, so independent queries can run
+    concurrently in one process (one GitData object per thread). The data
+    methods are generators that yield one Record (a read-only mapping) per
+    item, as each page of data is retrieved.
+
+    username     = GitHub authentication username ('' for anonymous access)
+    accesstoken  = PAT for the username; if omitted, looked up via setting()
+    source       = 'a' to call the GitHub API, 'c' to read cached data
+    api_url      = root URL for GitHub REST API calls
+    cache_folder = folder for cached data (None = gh_cache subfolder of the
+                   gitdata module)
+    verbose      = whether to display status information on console
+    """
+    def __init__(self, *, username='', accesstoken=None, source='a',
+                 api_url='https://api.github.com', cache_folder=None,
+                 verbose=False):
+        self.username = username
+        if accesstoken is None and username:
+            accesstoken = setting('github', username, 'pat')
+        self.accesstoken = accesstoken
+        self.datasource = 'c' if source.lower().startswith('c') else 'a'
+        self.api_url = api_url
+        self.cache_folder = cache_folder
+        self.requests_session = None
+        self.verbose = verbose
+        self.display_data = False
+        self.start_time = time.time()
+        self.tot_api_calls = 0
+        self.tot_api_bytes = 0
+        self.last_ratelimit = 0
+        self.last_remaining = 0
+        self.totals_lock = threading.Lock()
+        self.request_hooks = []
+        self.metrics = None
+        self.metrics_file = ''
+        self.unknownfieldname = set()
+        self.sort_memory = _settings.sort_memory
+        self.snapshot_keep = _settings.snapshot_keep
+        self.memo = None
+        self.inflight = dict()
+        self.inflight_lock = threading.Lock()
+        self.tot_coalesced = 0
+
+    def collabs(self, owner, repo, *, fields=None, audit2fa=False):
+        """Yield collaborators for a repo.
+
+        owner    = owner (org or user)
+        repo     = repo name
+        fields   = list of fields to be returned (see list_fields())
+        audit2fa = whether to only return collaborators with 2FA disabled
+        """
+        return self.data(fields=fields, **endpoint_spec(
+            'collab', owner=owner, repo=repo, audit2fa=audit2fa))
+
+    def commits(self, owner, repo, *, fields=None):
+        """Yield commits for a repo.
+
+        owner  = owner (org or user)
+        repo   = repo name
+        fields = list of fields to be returned (see list_fields())
+        """
+        return self.data(fields=fields,
+                         **endpoint_spec('commit', owner=owner, repo=repo))
+
+    def data(self, *, endpoint=None, entity=None, fields=None,
+             constants=None, headers=None):
+        """Yield records for any GitHub API endpoint; see github_records().
+        """
+        return github_records(endpoint=endpoint, entity=entity, fields=fields,
+                              constants=constants, headers=headers or {},
+                              source=self.datasource, state=self)
+
+    def members(self, *, org=None, team=None, fields=None,
+                audit2fa=False, adminonly=False):
+        """Yield members of an organization or team.
+
+        org       = organization name, or '*' for all orgs of the username
+        team      = team ID; if provided, org is ignored
+        fields    = list of fields to be returned (see list_fields())
+        audit2fa  = whether to only return members with 2FA disabled
+        adminonly = whether to only return members with role=admin
+        """
+        if team:
+            yield from self.data(fields=fields, **endpoint_spec(
+                'member', org=org, team=team))
+            return
+        for orgname in self.orgnames() if org == '*' else [org]:
+            yield from self.data(fields=fields, **endpoint_spec(
+                'member', org=orgname, audit2fa=audit2fa, adminonly=adminonly))
+
+    def orgnames(self):
+        """Get a sorted list of the orgs the username is a member of.
+        """
+        return sorted(org['login'].lower() for org in self.orgs(fields=['login']))
+
+    def orgs(self, *, fields=None):
+        """Yield org memberships for the username.
+
+        fields = list of fields to be returned (see list_fields())
+        """
+        return self.data(fields=fields,
+                         **endpoint_spec('org', authname=self.username))
+
+    def repos(self, *, org=None, user=None, fields=None):
+        """Yield repos for an organization or user.
+
+        org    = organization name, or '*' for all orgs of the username
+        user   = username (ignored if org is provided)
+        fields = list of fields to be returned (see list_fields())
+        """
+        if not org:
+            yield from self.data(fields=fields,
+                                 **endpoint_spec('repo', user=user))
+            return
+        for orgname in self.orgnames() if org == '*' else [org]:
+            yield from self.data(fields=fields,
+                                 **endpoint_spec('repo', org=orgname))
+
+    def teams(self, org, *, fields=None):
+        """Yield teams for an organization.
+
+        org    = organization name
+        fields = list of fields to be returned (see list_fields())
+        """
+        return self.data(fields=fields, **endpoint_spec('team', org=org))
+
+def github_allpages(*, endpoint=None, auth=None, headers=None, #-------------<<<
+                    state=None, maxpages=None):
+    """Get all pages of data from a GitHub API endpoint.
+
+    endpoint = HTTP endpoint for GitHub API call
+    auth     = tuple (username, PAT) for authentication, or None
+    headers  = HTTP headers to be included with API call
+    state    = settings object updated with API call totals (default _settings)
+    maxpages = maximum number of pages to retrieve (None = no limit)
+
+    Returns the aggregated payload of all pages (a list of dictionaries).
+    Raises IncompleteData if not all pages could be retrieved.
+    """
+    payload = []
+    for page in github_pages(endpoint=endpoint, auth=auth, headers=headers,
+                             state=state, maxpages=maxpages):
+        payload.extend(page)
+    return payload
+
+def github_api(*, endpoint=None, auth=None, headers=None, #------------------<<<
+               state=None):
+    """Call the GitHub REST API.
+
+    endpoint = HTTP endpoint for GitHub API call; either a path such as
+               '/orgs/octocat/repos' (appended to _settings.api_url) or a
+               full URL such as the pagination links returned by GitHub
+    auth     = tuple (username, PAT) for authentication, or None
+    headers  = HTTP headers to be included with API call
+    state    = settings object updated with API call totals (default _settings)
+
+    Returns the response object from the requests library.
+    """
+    if not state:
+        state = _settings
+
+    if not state.requests_session:
+        session_config(state=state)
+
+    if endpoint.lower().startswith(('http://', 'https://')):
+        url = endpoint
+    else:
+        url = state.api_url.rstrip('/') + endpoint
+
+    start = default_timer()
+    response = state.requests_session.get(url, auth=auth, headers=headers)
+    latency = default_timer() - start
+
+    remaining = None
+    with state.totals_lock:
+        state.tot_api_calls += 1
+        state.tot_api_bytes += len(response.content)
+        try:
+            state.last_ratelimit = int(response.headers['X-RateLimit-Limit'])
+            state.last_remaining = int(
+                response.headers['X-RateLimit-Remaining'])
+            remaining = state.last_remaining
+        except (KeyError, ValueError):
+            pass # no rate-limit headers in this response
+
+    if state.request_hooks:
+        parsed_url = urlparse(url)
+        page = parse_qs(parsed_url.query).get('page', ['1'])[0]
+        trace_event('request', state=state, endpoint=parsed_url.path,
+                    page=int(page) if page.isdigit() else None,
+                    status=response.status_code, seconds=latency,
+                    bytes=len(response.content), cache='miss',
+                    ratelimit_remaining=remaining)
+
+    return response
+
+def github_count(*, endpoint=None, headers=None, state=None): #--------------<<<
+    """Get the number of records returned by a GitHub API endpoint, without
+    retrieving them.
+
+    endpoint = HTTP endpoint for GitHub API call
+    headers  = HTTP headers to be included with API call
+    state    = settings object (default _settings)
+
+    If state.datasource is 'c', counts the records in the cached data.
+    Otherwise, requests one record per page (per_page=1) and gets the count
+    from the page number of the rel="last" link in the Link header. If there
+    is no rel="last" link but there are more pages, all pages are retrieved
+    and counted.
+
+    Returns the number of records, or None if not available.
+    """
+    if not state:
+        state = _settings
+
+    if state.datasource == 'c':
+        if not cache_exists(endpoint, state=state):
+            click.echo('ERROR: no cached data for ' + endpoint)
+            return None
+        return len(github_data_from_cache(endpoint, state=state))
+
+    if 'per_page=' in endpoint:
+        countpoint = re.sub(r'per_page=\d+', 'per_page=1', endpoint)
+    else:
+        countpoint = endpoint + ('&' if '?' in endpoint else '?') + 'per_page=1'
+    response = github_api(endpoint=countpoint, auth=auth_user(state),
+                          headers=headers, state=state)
+    if not response.ok:
+        click.echo('ERROR: HTTP ' + str(response.status_code) +
+                   ' returned for ' + countpoint)
+        return None
+
+    lastpage = response.links.get('last', {}).get('url')
+    if lastpage:
+        page = parse_qs(urlparse(lastpage).query).get('page', [''])[0]
+        if page.isdigit():
+            return int(page)
+    if 'next' in response.links:
+        # no usable rel="last" link, so count all pages
+        try:
+            return len(github_allpages(endpoint=endpoint,
+                                       auth=auth_user(state),
+                                       headers=headers, state=state))
+        except IncompleteData:
+            return None
+
+    page = response.json()
+    return len(page) if isinstance(page, list) else 1
+
 def github_data(*, endpoint=None, entity=None, fields=None, #----------------<<<
-                constants=None, headers=None):
+                constants=None, headers=None, state=None):
     """Get data for specified GitHub API endpoint.
     endpoint     = HTTP endpoint for GitHub API call
     entity       = entity type ('repo', 'member')
@@ -478,30 +2035,37 @@ def github_data(*, endpoint=None, entity=None, fields=None, #----------------<<<
                    specified fields but aren't returned by GitHub API (these are
                    typically criteria used in the API call)
     headers      = HTTP headers to be included with API call
+    state        = settings object (default _settings)
 
     Returns a list of dictionaries containing the specified fields.
     Returns a complete data set - if this endpoint does pagination, all pages
     are retrieved and aggregated.
     """
-    # _settings.datasource contains one of these three values:
+    if not state:
+        state = _settings
+
+    # state.datasource contains one of these three values:
     # 'a' = call the GitHub REST API to get the data
     # 'c' = get data from the locally cached data for this endpoint/username
     # 'p' (or None) = prompt the user for which data to use
 
-    if _settings.datasource == 'c' and not cache_exists(endpoint):
+    if memo_exists(endpoint, headers, state):
+        # retrieved earlier in this session; github_records() will use the
+        # in-memory data without reading from this source
+        read_from = 'c' if state.datasource == 'c' else 'a'
+    elif state.datasource == 'c' and not cache_exists(endpoint, state=state):
         click.echo('ERROR: cached data requested, but none found.')
         return []
-
-    if _settings.datasource == 'a':
+    elif state.datasource == 'a':
         read_from = 'a'
-    elif _settings.datasource == 'c':
+    elif state.datasource == 'c':
         read_from = 'c'
     else:
         # prompt user for which data source to use
         click.echo('    Endpoint: ', nl=False)
         click.echo(click.style(endpoint, fg='cyan'))
-        if cache_exists(endpoint):
-            filetime = time_stamp(cache_filename(endpoint))
+        if cache_exists(endpoint, state=state):
+            filetime = time_stamp(cache_filename(endpoint, state=state))
             click.echo(' Cached data: ', nl=False)
             click.echo(click.style(filetime, fg='cyan'))
             read_from = \
@@ -513,33 +2077,247 @@ def github_data(*, endpoint=None, entity=None, fields=None, #----------------<<<
     if read_from == 'x':
         sys.exit(0)
 
-    if read_from == 'a':
-        all_fields = github_allpages(endpoint=endpoint, auth=auth_user(),
-                                     headers=headers, state=_settings)
-        cache_update(endpoint, all_fields, constants)
-    elif read_from == 'c' and cache_exists(endpoint):
-        all_fields = github_data_from_cache(endpoint=endpoint)
-        if _settings.verbose:
-            nameonly = os.path.basename(cache_filename(endpoint))
+    usage_record(endpoint, state=state)
+    return list(github_records(endpoint=endpoint, entity=entity, fields=fields,
+                               constants=constants, headers=headers,
+                               source=read_from, state=state))
+
+def github_data_from_cache(endpoint=None, state=None): #---------------------<<<
+    """Get data from local cache file.
+
+    endpoint = GitHub API endpoint
+    state    = settings object (default _settings)
+    """
+    filename = cache_filename(endpoint, state=state)
+    return read_json(filename)
+
+def github_pages(*, endpoint=None, auth=None, headers=None, #----------------<<<
+                 state=None, maxpages=None):
+    """Generator that yields each page of data from a GitHub API endpoint.
+
+    endpoint = HTTP endpoint for GitHub API call
+    auth     = tuple (username, PAT) for authentication, or None
+    headers  = HTTP headers to be included with API call
+    state    = settings object updated with API call totals (default _settings)
+    maxpages = maximum number of pages to retrieve (None = no limit)
+
+    Follows the rel="next" links in the Link header. Each page is returned as
+    a list of dictionaries; an endpoint that returns a single object yields a
+    list containing that object.
+
+    Raises IncompleteData if a page can't be retrieved (after displaying the
+    error), or if another page is needed after maxpages pages, so that
+    callers don't save partial data.
+    """
+    pageno = 0
+    while endpoint:
+        if maxpages is not None and pageno >= maxpages:
+            raise IncompleteData('page limit reached for ' + endpoint)
+        response = github_api(endpoint=endpoint, auth=auth,
+                              headers=headers, state=state)
+        if not response.ok:
+            click.echo('ERROR: HTTP ' + str(response.status_code) +
+                       ' returned for ' + endpoint)
+            raise IncompleteData('HTTP ' + str(response.status_code) +
+                                 ' returned for ' + endpoint, response)
+        pageno += 1
+
+        start = default_timer()
+        page = response.json()
+        trace_event('parse', state=state, endpoint=urlparse(response.url).path,
+                    seconds=default_timer() - start,
+                    records=1 if isinstance(page, dict) else len(page))
+        yield [page] if isinstance(page, dict) else page
+
+        endpoint = response.links.get('next', {}).get('url')
+
+def github_records(*, endpoint=None, entity=None, fields=None, #-------------<<<
+                   constants=None, headers=None, source='a', state=None):
+    """Generator that yields the specified fields for each item returned by
+    a GitHub API endpoint.
+
+    endpoint  = HTTP endpoint for GitHub API call
+    entity    = entity type ('repo', 'member')
+    fields    = list of fields to be returned
+    constants = dictionary of fieldnames/values that can be included in the
+                specified fields but aren't returned by GitHub API
+    headers   = HTTP headers to be included with API call
+    source    = 'a' to call the GitHub API, 'c' to read cached data
+    state     = settings object (default _settings)
+
+    Records are yielded as each page is retrieved, so callers can start
+    processing before all pages have been returned. When reading from the
+    API, the cache file is updated after the last page has been retrieved.
+    When reading a narrow set of fields from the cache, records are streamed
+    from the cache file one at a time. Unlike github_data(), never prompts
+    for the data source.
+
+    If the in-memory cache has been enabled (see memo_config), data
+    retrieved earlier in the session is returned from memory if it is still
+    in the LRU cache, regardless of source. If another thread is already
+    fetching the same endpoint from the API, waits (up to INFLIGHT_TIMEOUT
+    seconds) for that fetch and uses its data instead of calling the API
+    again. A fetch in progress in the same thread isn't waited for, because
+    its pages are only retrieved as its records are consumed (for example,
+    two of these generators iterated with zip()).
+    """
+    if not state:
+        state = _settings
+
+    payload = None # set to the complete payload if it is to be saved
+    from_api = False
+    inflight_key = None # set if other callers may be waiting for this fetch
+    memo_payload = memo_get(endpoint, headers, state)
+    if memo_payload is not None:
+        pages = [memo_payload]
+        if state.request_hooks:
+            trace_event('request', state=state, endpoint=endpoint.split('?')[0],
+                        page=None, status=None, seconds=0.0, bytes=None,
+                        cache='memo', ratelimit_remaining=None)
+    elif source == 'a':
+        key = memo_key(endpoint, headers, state)
+        fetch = inflight_start(key, state)
+        shared_payload = None
+        if fetch and fetch['thread'] != threading.get_ident():
+            # another thread is fetching this endpoint, so use its payload
+            start = default_timer()
+            shared_payload = inflight_wait(fetch, INFLIGHT_TIMEOUT)
+            if shared_payload is not None and state.request_hooks:
+                trace_event('request', state=state,
+                            endpoint=endpoint.split('?')[0], page=None,
+                            status=None, seconds=default_timer() - start,
+                            bytes=None, cache='coalesced',
+                            ratelimit_remaining=None)
+        if shared_payload is not None:
+            pages = [shared_payload]
+        else:
+            # no other fetch, or it's in this thread, didn't complete or
+            # timed out, so call the API
+            inflight_key = None if fetch else key
+            pages = github_pages(endpoint=endpoint, auth=auth_user(state),
+                                 headers=headers, state=state)
+            payload = []
+            from_api = True
+    elif source == 'c' and cache_exists(endpoint, state=state):
+        start = default_timer()
+        if fields and fields[0] not in ['*', 'urls', 'nourls']:
+            # only the requested fields are needed, so stream the records
+            # (and keep the streamed records in memory, if enabled)
+            streamed = memo_get(endpoint, headers, state, fields)
+            if streamed is None:
+                streamed = cache_records(cache_filename(endpoint, state=state),
+                                         fields)
+                if state.memo is not None and state.memo.maxsize:
+                    streamed = memo_stream(streamed, endpoint, headers,
+                                           state, fields)
+            pages = [streamed]
+        else:
+            pages = [github_data_from_cache(endpoint=endpoint, state=state)]
+            memo_put(endpoint, headers, pages[0], state)
+        if state.request_hooks:
+            trace_event('request', state=state, endpoint=endpoint.split('?')[0],
+                        page=None, status=None, seconds=default_timer() - start,
+                        bytes=os.path.getsize(cache_filename(endpoint,
+                                                             state=state)),
+                        cache='hit', ratelimit_remaining=None)
+        if state.verbose:
+            nameonly = os.path.basename(cache_filename(endpoint, state=state))
             click.echo(' Data source: ', nl=False)
             click.echo(click.style(nameonly, fg='cyan'))
     else:
-        all_fields = []
+        return
 
-    # extract the requested fields and return them
-    retval = []
-    for json_item in all_fields:
-        retval.append(data_fields(entity=entity, jsondata=json_item,
-                                  fields=fields, constants=constants))
-    return retval
+    # extract the requested fields from each page
+    nrecords = 0
+    projection_time = 0.0
+    completed = False
+    try:
+        try:
+            for page in pages:
+                if from_api:
+                    payload.extend(page)
+                for json_item in page:
+                    start = default_timer()
+                    values = data_fields(entity=entity, jsondata=json_item,
+                                         fields=fields, constants=constants,
+                                         state=state)
+                    projection_time += default_timer() - start
+                    nrecords += 1
+                    yield values
+        except IncompleteData:
+            return # error already displayed; don't cache the partial data
+
+        trace_event('projection', state=state, entity=entity,
+                    records=nrecords, seconds=projection_time)
+        if from_api:
+            cache_update(endpoint, payload, constants, state=state)
+            memo_put(endpoint, headers, payload, state)
+        completed = True
+    finally:
+        if inflight_key:
+            # release any callers waiting for this fetch
+            inflight_end(inflight_key, payload if completed else None, state)
+
+class IncompleteData(Exception): #-------------------------------------------<<<
+    """Exception raised by github_pages() when not all pages of data could be
+    retrieved from an endpoint.
+
+    message  = description of the problem
+    response = the failed HTTP response, or None if the page limit was reached
+    """
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
 
-def github_data_from_cache(endpoint=None): #---------------------------------<<<
-    """Get data from local cache file.
+def inflight_end(key, payload, state): #-------------------------------------<<<
+    """End an endpoint fetch started with inflight_start().
 
-    endpoint = GitHub API endpoint
+    key     = the fetch's key
+    payload = the complete payload, or None if the fetch didn't complete
+    state   = settings object
+
+    Callers waiting in inflight_wait() receive the payload.
+    <internal>
     """
-    filename = cache_filename(endpoint)
-    return read_json(filename)
+    with state.inflight_lock:
+        fetch = state.inflight.pop(key)
+    fetch['payload'] = payload
+    fetch['done'].set()
+
+def inflight_start(key, state): #--------------------------------------------<<<
+    """Start an endpoint fetch, unless the same fetch is already in progress.
+
+    key   = key that identifies the fetch (see memo_key())
+    state = settings object
+
+    Returns None if the caller should do the fetch, and then call
+    inflight_end() when done. If another caller is already doing the fetch,
+    returns its dictionary, which has the fetching thread's id in 'thread':
+    the caller can pass it to inflight_wait() if it's another thread, but
+    shouldn't wait for a fetch in its own thread.
+    <internal>
+    """
+    with state.inflight_lock:
+        fetch = state.inflight.get(key)
+        if fetch is None:
+            state.inflight[key] = {'done': threading.Event(), 'payload': None,
+                                   'thread': threading.get_ident()}
+        elif fetch['thread'] != threading.get_ident():
+            state.tot_coalesced += 1
+    return fetch
+
+def inflight_wait(fetch, timeout=None): #------------------------------------<<<
+    """Wait for a fetch started by another thread to end.
+
+    fetch   = dictionary returned by inflight_start()
+    timeout = maximum number of seconds to wait (None = no limit)
+
+    Returns the payload, or None if the other thread didn't complete the fetch
+    within the timeout.
+    <internal>
+    """
+    fetch['done'].wait(timeout)
+    return fetch['payload']
 
 def inifile_name(): #--------------------------------------------------------<<<
     """Return full name of INI file where GitHub tokens are stored.
@@ -750,17 +2528,34 @@ def list_fields(entity=None): #----------------------------------------------<<<
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+@click.option('--count', is_flag=True, default=False,
+              help='display the number of members instead of retrieving them')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
 def members(org, team, audit2fa, adminonly, authuser, #----------------------<<<
-            source, filename, fields, display, verbose, listfields):
+            source, filename, fields, display, verbose, trace,
+            metrics, snapshots, sort, displaylimit, pager, count,
+            listfields):
     """Get member info for an organization or team.
     """
     if listfields:
@@ -778,18 +2573,40 @@ def members(org, team, audit2fa, adminonly, authuser, #----------------------<<<
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
     source = source if source else 'p'
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
     fldnames = fields.split('/') if fields else None
+    if count:
+        if team:
+            targets = [({'team': team}, endpoint_spec('member', org=org,
+                                                      team=team))]
+        else:
+            if org == '*' and not authuser:
+                click.echo('ERROR: -a option required for org=* syntax.')
+                return
+            targets = [({'org': orgid},
+                        endpoint_spec('member', org=orgid, audit2fa=audit2fa,
+                                      adminonly=adminonly))
+                       for orgid in (orglist(authuser) if org == '*' else [org])]
+        data_counts(targets, filename)
+        elapsed_time(start_time)
+        return
     templist = membersdata(org=org, team=team, audit2fa=audit2fa,
                            authname=authuser, adminonly=adminonly, fields=fldnames)
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
@@ -866,46 +2683,373 @@ def membersget(*, org=None, team=None, fields=None, #------------------------<<<
     return github_data(endpoint=endpoint, entity='member', fields=fields,
                        constants={"org": org}, headers={})
 
-def nested_json_value(nested_dict, dot_fldname): #---------------------------<<<
-    """Return a nested value from a JSON data structure.
+def memo_config(*, maxsize=128, ttl=300, state=None): #----------------------<<<
+    """Configure the in-memory LRU cache of endpoint data.
 
-    nested_dict = a JSON object, which contains nested dictionaries (nested up
-                  to 4 levels deep)
-    dot_fldname = a dot-notation reference to a value nested inside the JSON
-                  for example, 'commit.committer.date' would return the value
-                  nested_dict['commit']['committer']['date']
+    maxsize = maximum number of endpoints kept in memory (0 = disable)
+    ttl     = seconds before in-memory data expires (0 = never)
+    state   = settings object (default _settings)
+
+    Data returned by an endpoint is kept in memory, so later requests for the
+    same (auth, endpoint, headers) in this session don't read the cache file
+    or call the API. The in-memory cache is disabled until this function is
+    called; the gitdata command line and ghaudit call it at startup. Returns
+    the MemoCache object, which has hit/miss stats.
     """
-    depth = dot_fldname.count('.') + 1
-    keys = dot_fldname.split('.')
-    if depth == 1:
-        try:
-            retval = nested_dict[dot_fldname]
-        except (TypeError, KeyError):
-            _settings.unknownfieldname.add(dot_fldname)
-            retval = None
-    elif depth == 2:
-        try:
-            retval = nested_dict[keys[0]][keys[1]]
-        except (TypeError, KeyError):
-            _settings.unknownfieldname.add(dot_fldname)
-            retval = None
-    elif depth == 3:
+    if not state:
+        state = _settings
+    state.memo = MemoCache(maxsize=maxsize, ttl=ttl)
+    return state.memo
+
+def memo_exists(endpoint, headers, state): #---------------------------------<<<
+    """Check whether data for an endpoint is in the in-memory cache, without
+    updating the cache's hit/miss stats.
+    <internal>
+    """
+    if state.memo is None:
+        return False # in-memory cache not enabled
+    return memo_key(endpoint, headers, state) in state.memo
+
+def memo_get(endpoint, headers, state, fields=None): #-----------------------<<<
+    """Get the payload for an endpoint from the in-memory cache.
+
+    fields = if specified, get the records streamed from the cache file for
+             these fields (see github_records), instead of the full payload
+
+    Returns None if the endpoint isn't in the cache.
+    <internal>
+    """
+    if state.memo is None:
+        return None # in-memory cache not enabled
+    return state.memo.get(memo_key(endpoint, headers, state, fields))
+
+def memo_key(endpoint, headers, state, fields=None): #-----------------------<<<
+    """Get the in-memory cache key for an endpoint: (auth, endpoint, headers),
+    plus the field names for records streamed with only those fields.
+    <internal>
+    """
+    key = (state.username or '_anon', endpoint,
+           tuple(sorted((headers or {}).items())))
+    return key + (tuple(fields),) if fields else key
+
+def memo_put(endpoint, headers, payload, state, fields=None): #--------------<<<
+    """Save the payload for an endpoint in the in-memory cache.
+
+    fields = if specified, the payload is records streamed from the cache file
+             with only the data for these fields
+    <internal>
+    """
+    if state.memo is None:
+        return # in-memory cache not enabled
+    state.memo.put(memo_key(endpoint, headers, state, fields), payload)
+
+def memo_stream(records, endpoint, headers, state, fields): #----------------<<<
+    """Generator that yields records streamed from a cache file, and saves
+    them in the in-memory cache after the last one.
+
+    records  = iterable of records (see cache_records)
+    endpoint = the endpoint
+    headers  = the endpoint's HTTP headers
+    state    = settings object
+    fields   = the field names the records were streamed for
+    <internal>
+    """
+    saved = []
+    for record in records:
+        saved.append(record)
+        yield record
+    memo_put(endpoint, headers, saved, state, fields)
+
+class MemoCache: #-----------------------------------------------------------<<<
+    """Thread-safe LRU cache with a maximum size and time-to-live.
+
+    maxsize = maximum number of entries (0 = cache nothing)
+    ttl     = seconds before an entry expires (0 = never)
+
+    The hits, misses and evictions attributes are running totals.
+    """
+    def __init__(self, *, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict() # key = (time, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and not self.expired(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """Remove all entries.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def expired(self, entry):
+        """Check whether an entry is older than the ttl.
+        """
+        return self.ttl and time.time() - entry[0] >= self.ttl
+
+    def get(self, key):
+        """Get the value for a key; returns None if not found or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.expired(entry):
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Save the value for a key, evicting the least recently used entries
+        if the cache is full.
+        """
+        if not self.maxsize:
+            return
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Get a dictionary of cache statistics.
+        """
+        return {'entries': len(self.entries), 'maxsize': self.maxsize,
+                'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+def metrics_config(*, filename=None, port=None, state=None): #---------------<<<
+    """Enable collection of Prometheus metrics.
+
+    filename = optional Prometheus textfile-collector file (*.prom), which is
+               rewritten each time an endpoint's data has been retrieved and
+               when a command completes
+    port     = optional port number for a local HTTP server that returns the
+               metrics at /metrics
+    state    = settings object to collect metrics for (default _settings)
+
+    Metrics are collected from the state's trace events (see trace_addhook()).
+    Returns the HTTP server object if a port was specified, otherwise None.
+    """
+    if not state:
+        state = _settings
+    if state.metrics is None:
+        state.metrics = {'lock': threading.Lock(),
+                             'cache_hits': 0, 'cache_misses': 0,
+                             'latency_buckets': [0]*len(METRICS_BUCKETS),
+                             'latency_count': 0, 'latency_sum': 0.0,
+                             'last_request': 0.0,
+                             'records': collections.Counter(),
+                             'written': collections.Counter()}
+
+        def hook(eventdict):
+            """Hook function that updates this state's metrics.
+            """
+            metrics_hook(eventdict, state)
+        trace_addhook(hook, state)
+
+    if filename:
+        state.metrics_file = filename
+
+    if port:
+        server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+        server.state = state
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+    return None
+
+class MetricsHandler(BaseHTTPRequestHandler): #------------------------------<<<
+    """Request handler for the local metrics server started by metrics_config().
+    """
+    def do_GET(self): # pylint: disable=C0103
+        """Return the current metrics in Prometheus text format.
+        """
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics_text(self.server.state).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        """Suppress the default request logging to stderr.
+        """
+        pass
+
+def metrics_hook(eventdict, state=None): #-----------------------------------<<<
+    """Trace hook that updates the metric values in state.metrics.
+
+    eventdict = the trace event (see trace_addhook())
+    state     = settings object the event was sent for (default _settings)
+
+    Registered by metrics_config(), for the state whose metrics it collects.
+    <internal>
+    """
+    if not state:
+        state = _settings
+    metrics = state.metrics
+    event = eventdict['event']
+    with metrics['lock']:
+        if event == 'request' and eventdict['cache'] != 'miss':
+            metrics['cache_hits'] += 1
+        elif event == 'request':
+            metrics['cache_misses'] += 1
+            metrics['latency_count'] += 1
+            metrics['latency_sum'] += eventdict['seconds']
+            metrics['last_request'] = eventdict['timestamp']
+            for bucketno, upper_bound in enumerate(METRICS_BUCKETS):
+                if eventdict['seconds'] <= upper_bound:
+                    metrics['latency_buckets'][bucketno] += 1
+        elif event == 'projection':
+            metrics['records'][eventdict['entity'] or 'unknown'] += \
+                eventdict['records']
+        elif event == 'output':
+            target = 'console' if eventdict['target'] == 'console' else 'file'
+            metrics['written'][target] += eventdict['records']
+
+    if state.metrics_file and event in ['projection', 'elapsed']:
+        metrics_write(state.metrics_file, state)
+
+def metrics_text(state=None): #----------------------------------------------<<<
+    """Get current metrics in the Prometheus text exposition format.
+
+    state = settings object the metrics were collected for (default _settings)
+
+    Returns a string containing the metrics.
+    """
+    if not state:
+        state = _settings
+    metrics = state.metrics
+    if metrics is None:
+        return ''
+
+    lines = []
+    def metric(name, mtype, helptext, samples):
+        """Add a metric to the output. samples = list of (suffix/labels, value).
+        """
+        lines.append('# HELP ' + name + ' ' + helptext)
+        lines.append('# TYPE ' + name + ' ' + mtype)
+        for suffix, value in samples:
+            lines.append(name + suffix + ' ' + repr(value))
+
+    with metrics['lock']:
+        metric('gitdata_api_calls_total', 'counter',
+               'GitHub API calls made.', [('', state.tot_api_calls)])
+        metric('gitdata_api_bytes_total', 'counter',
+               'Bytes returned by GitHub API calls.',
+               [('', state.tot_api_bytes)])
+        metric('gitdata_cache_hits_total', 'counter',
+               'Endpoint data read from the local cache.',
+               [('', metrics['cache_hits'])])
+        metric('gitdata_cache_misses_total', 'counter',
+               'API requests made because data was read from the API.',
+               [('', metrics['cache_misses'])])
+        buckets = []
+        for upper_bound, count in zip(METRICS_BUCKETS, metrics['latency_buckets']):
+            label = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+            buckets.append(('_bucket{le="' + label + '"}', count))
+        metric('gitdata_request_latency_seconds', 'histogram',
+               'Latency of GitHub API requests.',
+               buckets + [('_sum', round(metrics['latency_sum'], 6)),
+                          ('_count', metrics['latency_count'])])
+        metric('gitdata_ratelimit_limit', 'gauge',
+               'API rate limit as of the most recent API call.',
+               [('', state.last_ratelimit)])
+        metric('gitdata_ratelimit_remaining', 'gauge',
+               'Remaining API rate limit as of the most recent API call.',
+               [('', state.last_remaining)])
+        metric('gitdata_last_request_timestamp_seconds', 'gauge',
+               'Time of the most recent API call.',
+               [('', metrics['last_request'])])
+        metric('gitdata_records_total', 'counter',
+               'Records returned, by entity type.',
+               [('{entity="' + entity + '"}', count)
+                for entity, count in sorted(metrics['records'].items())])
+        metric('gitdata_records_written_total', 'counter',
+               'Records written to the console or output files.',
+               [('{target="' + target + '"}', count)
+                for target, count in sorted(metrics['written'].items())])
+
+    return '\n'.join(lines) + '\n'
+
+def metrics_write(filename, state=None): #-----------------------------------<<<
+    """Write current metrics to a Prometheus textfile-collector file.
+
+    filename = name of the *.prom file
+    state    = settings object the metrics were collected for (default
+               _settings)
+
+    The file is written under a temporary name and then renamed, so that the
+    collector never reads a partially written file.
+    """
+    tempname = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(tempname, 'w') as fhandle:
+        fhandle.write(metrics_text(state))
+    os.replace(tempname, filename)
+
+def nested_json_value(nested_dict, dot_fldname, state=None): #---------------<<<
+    """Return a nested value from a JSON data structure.
+
+    nested_dict = a JSON object, which contains nested dictionaries (nested up
+                  to 4 levels deep)
+    dot_fldname = a dot-notation reference to a value nested inside the JSON
+                  for example, 'commit.committer.date' would return the value
+                  nested_dict['commit']['committer']['date']
+    state       = settings object where unknown field names are recorded
+                  (default _settings)
+    """
+    if not state:
+        state = _settings
+    depth = dot_fldname.count('.') + 1
+    keys = dot_fldname.split('.')
+    if depth == 1:
+        try:
+            retval = nested_dict[dot_fldname]
+        except (TypeError, KeyError):
+            state.unknownfieldname.add(dot_fldname)
+            retval = None
+    elif depth == 2:
+        try:
+            retval = nested_dict[keys[0]][keys[1]]
+        except (TypeError, KeyError):
+            state.unknownfieldname.add(dot_fldname)
+            retval = None
+    elif depth == 3:
         try:
             retval = nested_dict[keys[0]][keys[1]][keys[2]]
         except (TypeError, KeyError):
-            _settings.unknownfieldname.add(dot_fldname)
+            state.unknownfieldname.add(dot_fldname)
             retval = None
     elif depth == 4:
         try:
             retval = nested_dict[keys[0]][keys[1]][keys[2]][keys[3]]
         except (TypeError, KeyError):
-            _settings.unknownfieldname.add(dot_fldname)
+            state.unknownfieldname.add(dot_fldname)
             retval = None
     else:
         try:
             retval = nested_dict[keys[0]][keys[1]][keys[2]][keys[3]][keys[4]]
         except (TypeError, KeyError):
-            _settings.unknownfieldname.add(dot_fldname)
+            state.unknownfieldname.add(dot_fldname)
             retval = None
     return retval
 
@@ -934,17 +3078,31 @@ def orglist(authname=None, contoso=False): #---------------------------------<<<
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
 def orgs(authuser, source, filename, fields, #-------------------------------<<<
-         display, verbose, listfields):
+         display, verbose, trace, metrics, snapshots, sort,
+         displaylimit, pager, listfields):
     """Get organization information.
     """
     if listfields:
@@ -962,9 +3120,16 @@ def orgs(authuser, source, filename, fields, #-------------------------------<<<
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
     source = source if source else 'p'
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
@@ -974,12 +3139,352 @@ def orgs(authuser, source, filename, fields, #-------------------------------<<<
         constants={"user": authuser}, headers={})
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
     elapsed_time(start_time)
 
+@cli.command(help='Query cached data (no API calls)')
+@click.argument('entity', type=click.Choice(['collabs', 'commits', 'members',
+                                             'orgs', 'repos', 'teams']),
+                metavar='<entity>')
+@click.option('-o', '--org', default='',
+              help='org or owner (* = all cached orgs)', metavar='<str>')
+@click.option('-u', '--user', default='',
+              help='GitHub user (repos)', metavar='<str>')
+@click.option('-t', '--team', default='',
+              help='team ID (members)', metavar='<str>')
+@click.option('-r', '--repo', default='',
+              help='repo name (collabs/commits, * = all cached repos)',
+              metavar='<str>')
+@click.option('-a', '--authuser', default='',
+              help='authentication username', metavar='<str>')
+@click.option('-w', '--where', multiple=True,
+              help='filter, e.g. language=Python or created_at>=2016 ' +
+              '(operators = != < <= > >= ~)', metavar='<str>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('-n', '--filename', default='',
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
+@click.option('-f', '--fields', default='',
+              help='fields to include', metavar='<str>')
+@click.option('-d', '--display', is_flag=True, default=True,
+              help="Don't display retrieved data")
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help="Display verbose status info")
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+def query(entity, org, user, team, repo, authuser, where, sort, #------------<<<
+          filename, fields, display, verbose, displaylimit, pager):
+    """Query cached data.
+
+    Reads the cache files for the specified entity type and org/user/team/repo
+    (which may include * wildcards), filters records with --where predicates,
+    and returns the specified fields. Predicates and fields are evaluated
+    against the columnar index of each cache file, which is built when first
+    needed and rebuilt if the cache file changes. A predicate such as
+    name=gitdata (equality on id, login, name or sha) reads only the matching
+    record, via the cache file's offset index.
+    """
+    if entity in ['collabs', 'commits'] and (not org or not repo):
+        click.echo('ERROR: must specify owner and repo')
+        return
+    if entity in ['repos', 'members', 'teams'] and \
+        not org and not (entity == 'repos' and user) and \
+        not (entity == 'members' and team):
+        click.echo('ERROR: must specify an org' +
+                   (' or user' if entity == 'repos' else '') +
+                   (' or team ID' if entity == 'members' else ''))
+        return
+    if not filename_valid(filename):
+        return
+
+    start_time = default_timer()
+
+    _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
+    _settings.verbose = verbose
+    auth_config({'username': authuser})
+
+    try:
+        predicates = [query_predicate(text) for text in where]
+    except ValueError as err:
+        click.echo('ERROR: ' + str(err))
+        return
+
+    endpoint = {'collabs': '/repos/' + org + '/' + repo + '/collaborators',
+                'commits': '/repos/' + org + '/' + repo + '/commits',
+                'members': '/teams/' + team + '/members' if team else
+                           '/orgs/' + org + '/members',
+                'orgs': '/user/orgs',
+                'repos': '/orgs/' + org + '/repos' if org else
+                         '/users/' + user + '/repos',
+                'teams': '/orgs/' + org + '/teams'}[entity]
+    fldnames = fields.split('/') if fields else default_fields(entity[:-1])
+
+    templist = []
+    for cachefile in cache_glob(endpoint):
+        if verbose:
+            click.echo(' Data source: ', nl=False)
+            click.echo(click.style(os.path.basename(cachefile), fg='cyan'))
+        templist.extend(query_cachefile(cachefile, predicates, fldnames,
+                                        entity[:-1]))
+
+    # handle returned data
+    sorted_data = sort_records(templist, sort)
+    data_display(sorted_data)
+    data_write(filename, sorted_data)
+
+    elapsed_time(start_time)
+
+def query_cachefile(filename, predicates, fields, entity): #-----------------<<<
+    """Query one cache file.
+
+    filename   = cache filename
+    predicates = list of predicates, as returned by query_predicate()
+    fields     = list of fields to be returned
+    entity     = entity type ('repo', 'member')
+
+    Returns a list of dictionaries containing the specified fields, for the
+    records that match all predicates.
+    <internal>
+    """
+    tests = [(pred[0], query_test(pred)) for pred in predicates]
+    for path, operation, literal in predicates:
+        if operation != '=' or path not in CACHE_KEYNAMES or \
+            (path == 'id' and not literal.isdigit()):
+            continue
+        # equality on a key field, so read only the matching record via the
+        # cache file's offset index
+        items = cache_lookupfile(filename, path,
+                                 str(int(literal)) if path == 'id' else literal)
+        return [data_fields(entity=entity, jsondata=item, fields=fields)
+                for item in items
+                if all(test(query_value(item, path)) for path, test in tests)]
+
+    shorthand = fields[0] in ['*', 'urls', 'nourls']
+    paths = [pred[0] for pred in predicates]
+    if not shorthand:
+        paths.extend(fields)
+
+    columns = query_columns(filename, paths)
+    if columns is None:
+        # a field that isn't in the columnar index, so scan the cache data,
+        # keeping only the values needed for the predicates and fields (all
+        # values for a shorthand field list)
+        return [data_fields(entity=entity, jsondata=item, fields=fields)
+                for item in cache_records(filename, [] if shorthand else paths)
+                if all(test(query_value(item, path)) for path, test in tests)]
+
+    # evaluate the predicates one column at a time
+    rows = range(columns['count'])
+    for predicate in predicates:
+        column = columns[predicate[0]]
+        test = query_test(predicate)
+        rows = [rowno for rowno in rows if test(column[rowno])]
+
+    if shorthand:
+        # shorthand field lists aren't in the columnar index, so project the
+        # matching rows from the cache data, one record at a time
+        rows = set(rows)
+        return [data_fields(entity=entity, jsondata=item, fields=fields)
+                for rowno, item in enumerate(cache_records(filename, []))
+                if rowno in rows]
+
+    # the column for each output field (if a field name is repeated, the
+    # last one is used, as in data_fields)
+    sources = dict()
+    for fldname in fields:
+        sources[fldname.replace('.', '_')] = fldname
+    rowclass = record_class(tuple(sources))
+    retval = []
+    for rowno in rows:
+        values = []
+        for fldname in sources.values():
+            value = columns[fldname][rowno]
+            if fldname.lower() == 'private':
+                value = 'private' if value else 'public'
+            values.append(value)
+        retval.append(rowclass(values))
+    return retval
+
+def query_columns(filename, paths): #----------------------------------------<<<
+    """Get columns from the columnar index for a cache file.
+
+    filename = cache filename
+    paths    = list of field paths (dot notation) needed
+
+    The index is a folder alongside the cache file, containing a JSON list of
+    values for each non-URL field (nested up to 3 levels deep). It's built
+    the first time it's needed, and rebuilt if the cache file has changed.
+
+    Returns a dictionary of lists (one per path) plus a 'count' entry, or
+    None if any of the paths aren't in the index (or the index was replaced
+    by another process while it was being read).
+    <internal>
+    """
+    indexfolder = os.path.splitext(filename)[0] + '.columns'
+    cachestat = os.stat(filename)
+    try:
+        meta = read_json(os.path.join(indexfolder, '_meta.json'))
+    except (OSError, ValueError):
+        meta = None
+    if not meta or meta['mtime'] != cachestat.st_mtime or \
+        meta['size'] != cachestat.st_size:
+        with cache_lock(filename):
+            meta = query_index(filename, indexfolder)
+
+    if not all(path in meta['paths'] for path in paths):
+        return None
+
+    columns = {'count': meta['count']}
+    try:
+        for path in set(paths):
+            columns[path] = read_json(os.path.join(indexfolder,
+                                                   meta['paths'][path]))
+    except (OSError, ValueError):
+        return None
+    return columns
+
+def query_index(filename, indexfolder): #------------------------------------<<<
+    """Build the columnar index for a cache file. The caller must hold the
+    cache file's lock (see cache_lock()).
+
+    filename    = cache filename
+    indexfolder = folder where the index is written
+
+    The index is written to a temporary folder that then replaces the index
+    folder, so that readers never see a partially written index.
+
+    Returns the index's metadata (also written to _meta.json): a dictionary
+    with the record count, a 'paths' dictionary of the field paths and their
+    column filenames, and the cache file's modification time and size.
+    <internal>
+    """
+    cachestat = os.stat(filename)
+    records = read_json(filename)
+
+    containers = set() # paths that contain a dictionary or list in any record
+
+    def leaf_values(item, prefix, depth):
+        """Generator for (path, value) tuples of the non-URL scalar values.
+        """
+        for key, value in item.items():
+            if key.endswith('url'):
+                continue
+            if isinstance(value, (dict, list)):
+                containers.add(prefix + key)
+                if isinstance(value, dict) and depth < 3:
+                    yield from leaf_values(value, prefix + key + '.', depth + 1)
+            else:
+                yield prefix + key, value
+
+    columns = collections.OrderedDict()
+    for rowno, item in enumerate(records):
+        for path, value in leaf_values(item, '', 1):
+            if path not in columns:
+                columns[path] = [None]*len(records)
+            columns[path][rowno] = value
+    for path in containers:
+        columns.pop(path, None) # e.g., license is a dictionary or None
+
+    tempfolder = indexfolder + '.' + os.urandom(4).hex() + '.tmp'
+    oldfolder = indexfolder + '.' + os.urandom(4).hex() + '.tmp'
+    os.makedirs(tempfolder)
+    try:
+        paths = dict()
+        for colno, (path, column) in enumerate(columns.items()):
+            paths[path] = 'col' + str(colno) + '.json'
+            with open(os.path.join(tempfolder, paths[path]), 'w') as fhandle:
+                fhandle.write(json.dumps(column))
+        meta = {'count': len(records), 'paths': paths,
+                'mtime': cachestat.st_mtime, 'size': cachestat.st_size}
+        with open(os.path.join(tempfolder, '_meta.json'), 'w') as fhandle:
+            fhandle.write(json.dumps(meta))
+
+        # a folder can't be replaced in one step, so the old index is moved
+        # aside first (readers of the old index fall back to the cache data)
+        if os.path.isdir(indexfolder):
+            os.rename(indexfolder, oldfolder)
+        os.rename(tempfolder, indexfolder)
+    except BaseException:
+        remove_path(tempfolder)
+        raise
+    remove_path(oldfolder)
+
+    return meta
+
+def query_predicate(text): #-------------------------------------------------<<<
+    """Parse a --where predicate.
+
+    text = predicate such as 'language=Python' or 'created_at>=2016-01-01'
+
+    Returns a (path, operation, literal) tuple. Raises ValueError if the
+    predicate can't be parsed.
+    <internal>
+    """
+    match = re.match(r'^\s*([\w.]+)\s*(!=|<=|>=|=|<|>|~)\s*(.*?)\s*$', text)
+    if not match:
+        raise ValueError('invalid --where predicate: ' + text)
+    return match.groups()
+
+def query_test(predicate): #-------------------------------------------------<<<
+    """Get a test function for a predicate.
+
+    predicate = (path, operation, literal) tuple from query_predicate()
+
+    Returns a function that takes a field value and returns True if the value
+    satisfies the predicate. Strings are compared to the literal as entered,
+    other types to the literal converted to a boolean, null or number (e.g.,
+    private=true, size>1000). Values that can't be compared to the literal
+    (such as None for a < comparison) don't match.
+    <internal>
+    """
+    _, operation, literal = predicate
+    if operation == '~':
+        lowered = literal.lower()
+        return lambda value: lowered in str(value).lower()
+
+    if literal.lower() in ['true', 'false']:
+        typed = literal.lower() == 'true'
+    elif literal.lower() in ['null', 'none']:
+        typed = None
+    else:
+        try:
+            typed = float(literal)
+        except ValueError:
+            typed = literal
+
+    compare = {'=': operator.eq, '!=': operator.ne, '<': operator.lt,
+               '<=': operator.le, '>': operator.gt, '>=': operator.ge}[operation]
+
+    def test(value):
+        """Test function for this predicate.
+        """
+        try:
+            return compare(value, literal if isinstance(value, str) else typed)
+        except TypeError:
+            return False
+    return test
+
+def query_value(item, path): #-----------------------------------------------<<<
+    """Get the value of a dot-notation path from a cached record.
+
+    Returns None if the path doesn't exist. Unlike nested_json_value(), doesn't
+    log unknown field names.
+    <internal>
+    """
+    value = item
+    for key in path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
 def read_json(filename=None): #----------------------------------------------<<<
     """Read .json file into a Python object.
 
@@ -991,6 +3496,91 @@ def read_json(filename=None): #----------------------------------------------<<<
         retval = json.loads(datafile.read())
     return retval
 
+class Record(collections.abc.Mapping): #-------------------------------------<<<
+    """Compact, read-only record returned by data_fields().
+
+    A Record holds the values of one record in a tuple; the field names are
+    stored once, in the subclass created by record_class() for each list of
+    field names. Records can be used like a read-only OrderedDict (keys(),
+    values(), items(), record[name], record.get(name), dict(record)), at a
+    fraction of the memory.
+    """
+    __slots__ = ('_values',)
+    _fields = () # field names, set by record_class()
+    _index = dict() # key = field name, value = position in _values
+    classes = dict() # key = tuple of field names, value = Record subclass
+
+    def __init__(self, values):
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __reduce__(self):
+        return (record_new, (self._fields, self._values))
+
+    def __repr__(self):
+        return 'Record(' + repr(list(self.items())) + ')'
+
+    def items(self):
+        """Get a list of (fieldname, value) tuples.
+        """
+        return list(zip(self._fields, self._values))
+
+    def keys(self):
+        """Get the field names.
+        """
+        return self._fields
+
+    def values(self):
+        """Get the values.
+        """
+        return self._values
+
+def record_class(fields): #--------------------------------------------------<<<
+    """Get the Record subclass for a tuple of field names.
+
+    The subclasses are created when first needed, and reused for all records
+    that have the same field names.
+    <internal>
+    """
+    rowclass = Record.classes.get(fields)
+    if rowclass is None:
+        rowclass = type('Record', (Record,),
+                        {'__slots__': (), '_fields': fields,
+                         '_index': {name: position for position, name
+                                    in enumerate(fields)}})
+        rowclass = Record.classes.setdefault(fields, rowclass)
+    return rowclass
+
+def record_new(fields, values): #--------------------------------------------<<<
+    """Create a Record from field names and values (used to unpickle Records).
+    <internal>
+    """
+    return record_class(tuple(fields))(values)
+
+def remove_path(path): #-----------------------------------------------------<<<
+    """Remove a file, or a folder and the files it contains.
+
+    path = the file or folder to remove; does nothing if it doesn't exist
+    <internal>
+    """
+    try:
+        if os.path.isdir(path):
+            for entry in os.scandir(path):
+                os.remove(entry.path)
+            os.rmdir(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
 @cli.command(help='Get repo information by org or user/owner')
 @click.option('-o', '--org', default='',
               help='GitHub org (* = all orgs authuser is a member of)', metavar='<str>')
@@ -1001,17 +3591,40 @@ def read_json(filename=None): #----------------------------------------------<<<
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+@click.option('-j', '--jobs', default=1,
+              help='export cached data with this many processes '
+              '(requires -sc and -n; records are written in cache order, '
+              'not sorted, and not displayed)',
+              metavar='<int>')
+@click.option('--incremental', is_flag=True, default=False,
+              help='only get repos updated since the cached data')
+@click.option('--count', is_flag=True, default=False,
+              help='display the number of repos instead of retrieving them')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
 def repos(org, user, authuser, source, filename, #---------------------------<<<
-          fields, display, verbose, listfields):
+          fields, display, verbose, trace, metrics, snapshots, sort,
+          displaylimit, pager, jobs, incremental, count, listfields):
     """Get repository information.
     """
     if listfields:
@@ -1024,28 +3637,69 @@ def repos(org, user, authuser, source, filename, #---------------------------<<<
         return
     if not filename_valid(filename):
         return
+    if jobs > 1 and (not source.lower().startswith('c') or not filename or
+                     sort):
+        click.echo('ERROR: --jobs requires -sc and -n, and no --sort')
+        return
+    if jobs > 1 and org == '*' and not authuser:
+        click.echo('ERROR: -a option required for org=* syntax.')
+        return
+    if incremental and jobs > 1:
+        click.echo('ERROR: --incremental and --jobs can\'t be combined')
+        return
+    if incremental and source.lower().startswith('c'):
+        click.echo('ERROR: --incremental requires -sa (it calls the API)')
+        return
 
     start_time = default_timer()
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
-    source = source if source else 'p'
+    source = 'a' if incremental else (source if source else 'p')
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
     fldnames = fields.split('/') if fields else None
-    templist = reposdata(org=org, user=user, fields=fldnames, authname=authuser)
+    if count:
+        if org == '*' and not authuser:
+            click.echo('ERROR: -a option required for org=* syntax.')
+            return
+        targets = [({'org': orgid}, endpoint_spec('repo', org=orgid))
+                   for orgid in (orglist(authuser) if org == '*' else [org])] \
+            if org else [({'user': user}, endpoint_spec('repo', user=user))]
+        data_counts(targets, filename)
+        elapsed_time(start_time)
+        return
+
+    if jobs > 1:
+        orgs = orglist(authuser) if org == '*' else [org]
+        sources = [endpoint_spec('repo', org=orgid) for orgid in orgs] \
+            if org else [endpoint_spec('repo', user=user)]
+        export_jobs(filename, sources, fldnames, jobs)
+        elapsed_time(start_time)
+        return
+
+    templist = reposdata(org=org, user=user, fields=fldnames, authname=authuser,
+                         incremental=incremental)
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
     elapsed_time(start_time)
 
-def reposdata(*, org=None, user=None, fields=None, authname=None): #---------<<<
+def reposdata(*, org=None, user=None, fields=None, authname=None, #----------<<<
+              incremental=False):
     """Get repo information for one or more organizations or users.
 
     org      = organization; an organization or list of organizations
@@ -1061,10 +3715,13 @@ def reposdata(*, org=None, user=None, fields=None, authname=None): #---------<<<
                fields=['nourls'] -> return all non-URL fields (not *_url or url)
                fields=['urls'] ----> return all URL fields (*_url and url)
     authname = GitHub authentication username; required for org=* syntax
+    incremental = whether to only retrieve repos updated since the cached
+                  data for each org/user (see reposincremental())
 
     Returns a list of dictionary objects, one per repo.
     """
     repolist = [] # the list of repos that will be returned
+    getrepos = reposincremental if incremental else reposget
 
     if org:
         # get repos by organization
@@ -1075,16 +3732,73 @@ def reposdata(*, org=None, user=None, fields=None, authname=None): #---------<<<
                 return []
             user_orgs = orglist(authname)
             for orgid in user_orgs:
-                repolist.extend(reposget(org=orgid, fields=fields))
+                repolist.extend(getrepos(org=orgid, fields=fields))
         else:
             # get repos for specified organization
-            repolist.extend(reposget(org=org, fields=fields))
+            repolist.extend(getrepos(org=org, fields=fields))
     else:
         # get repos by user
-        repolist.extend(reposget(user=user, fields=fields))
+        repolist.extend(getrepos(user=user, fields=fields))
 
     return repolist
 
+def reposincremental(*, org=None, user=None, fields=None): #-----------------<<<
+    """Get repo information for a specified org or user, retrieving only the
+    repos that have changed since the cached data was retrieved. Called by
+    reposdata() for the --incremental option.
+
+    org = organization name
+    user = username (ignored if org is provided)
+    fields = list of fields to be returned
+
+    Repos are requested in order of most recently updated (updated_at), and
+    pagination stops at the first repo whose updated_at is older than the
+    newest updated_at in the cached data. The changed repos replace the
+    cached repos with the same id (and new repos are added), and the cache
+    file is updated. Repos that have been deleted remain in the cached data,
+    and a change that doesn't update a repo's updated_at (for example, a
+    push that only changes pushed_at) isn't retrieved. If there is no cached
+    data for this org or user, all repos are retrieved.
+
+    Returns a list of dictionaries containing the specified fields.
+    <internal>
+    """
+    spec = endpoint_spec('repo', org=org, user=user)
+    if not cache_exists(spec['endpoint']):
+        return github_data(fields=fields, **spec)
+
+    cached = github_data_from_cache(spec['endpoint'])
+    newest = max((repo.get('updated_at') or '' for repo in cached), default='')
+
+    changed = dict() # key = repo id, value = repo data
+    try:
+        for page in github_pages(
+                endpoint=spec['endpoint'] + '&sort=updated&direction=desc',
+                auth=auth_user(), headers=spec['headers']):
+            for repo in page:
+                if (repo.get('updated_at') or '') < newest:
+                    break
+                changed[repo['id']] = repo
+            else:
+                continue
+            break # older than the cached data, so no more pages needed
+    except IncompleteData:
+        # error already displayed, so return the cached data unchanged
+        return [data_fields(entity='repo', jsondata=repo, fields=fields)
+                for repo in cached]
+
+    if _settings.verbose:
+        click.echo('Changed repos: ', nl=False)
+        click.echo(click.style(str(len(changed)), fg='cyan'))
+
+    merged = [changed.pop(repo['id'], repo) for repo in cached]
+    merged.extend(changed.values()) # new repos
+    usage_record(spec['endpoint'])
+    cache_update(spec['endpoint'], merged, spec['constants'])
+
+    return [data_fields(entity='repo', jsondata=repo, fields=fields)
+            for repo in merged]
+
 def reposget(*, org=None, user=None, fields=None): #-------------------------<<<
     """Get repo information for a specified org or user. Called by repos() to
     aggregate repo information for multiple orgs or users.
@@ -1112,6 +3826,258 @@ def reposget(*, org=None, user=None, fields=None): #-------------------------<<<
     return github_data(endpoint=endpoint, entity='repo', fields=fields,
                        headers=headers)
 
+@cli.command(help='Run a local HTTP/JSON API with a warm in-memory cache')
+@click.option('-a', '--authuser', default='',
+              help='authentication username', metavar='<str>')
+@click.option('-s', '--source', default='a',
+              help='data source for endpoints not in memory - a/API or c/cache',
+              metavar='<str>')
+@click.option('--host', default='127.0.0.1',
+              help='interface to listen on', metavar='<str>')
+@click.option('--port', default=8080,
+              help='port to listen on', metavar='<int>')
+@click.option('--ttl', default=300,
+              help='seconds before in-memory data is refreshed', metavar='<int>')
+@click.option('--maxsize', default=1000,
+              help='max endpoints kept in memory', metavar='<int>')
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help='log requests and cache updates')
+@click.option('--trace', default='',
+              help='write trace events to a JSON Lines file', metavar='<str>')
+def serve(authuser, source, host, port, ttl, maxsize, verbose, trace): #-----<<<
+    """Run the gitdata HTTP/JSON API server.
+    """
+    client = ServeClient(username=authuser, source=source if source else 'a',
+                         verbose=verbose, ttl=ttl, maxsize=maxsize)
+    if trace:
+        trace_file(trace, state=client)
+
+    server = ThreadingHTTPServer((host, port), ServeHandler)
+    server.client = client
+    click.echo('Serving gitdata API at ', nl=False)
+    click.echo(click.style('http://' + host + ':' + str(port), fg='cyan'))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+class ServeClient(GitData): #------------------------------------------------<<<
+    """GitData client used by the serve command.
+
+    Keeps the complete payload returned by each endpoint in its in-memory
+    LRU cache for ttl seconds, so repeated queries are answered without
+    reading the cache file or calling the API. Concurrent requests for an
+    endpoint that isn't in memory are coalesced into a single fetch by
+    github_records().
+
+    The client is shared by the server's request threads: each thread has
+    its own requests session, and the API call totals are updated under
+    totals_lock.
+    """
+    def __init__(self, *, ttl=300, maxsize=1000, **kwargs):
+        self.threadlocal = threading.local()
+        super().__init__(**kwargs)
+        memo_config(maxsize=maxsize, ttl=ttl, state=self)
+
+    @property
+    def requests_session(self):
+        """The current thread's requests session, or None if it hasn't been
+        created yet (github_api() calls session_config() to create it).
+        """
+        return getattr(self.threadlocal, 'session', None)
+
+    @requests_session.setter
+    def requests_session(self, session):
+        self.threadlocal.session = session
+
+    def status(self):
+        """Get a dictionary of server status values.
+        """
+        with self.totals_lock:
+            return {'uptime': round(time.time() - self.start_time, 3),
+                    'api_calls': self.tot_api_calls,
+                    'api_bytes': self.tot_api_bytes,
+                    'ratelimit_limit': self.last_ratelimit,
+                    'ratelimit_remaining': self.last_remaining,
+                    'memo': self.memo.stats(),
+                    'coalesced': self.tot_coalesced}
+
+class ServeHandler(BaseHTTPRequestHandler): #--------------------------------<<<
+    """Request handler for the serve command's HTTP/JSON API.
+
+    GET /repos?org=<org>|user=<user>, /members?org=<org>|team=<id>,
+    /teams?org=<org>, /collabs?owner=<owner>&repo=<repo> and
+    /commits?owner=<owner>&repo=<repo> return a JSON list of records. These
+    optional parameters are also supported: fields (slash-separated, as for
+    the --fields option), sort (as for the --sort option), audit2fa and
+    adminonly (members and collabs). GET /status returns server status.
+
+    Errors are returned as a JSON object with an error value and HTTP status
+    400 or 404 for an invalid query, 502 if a GitHub API call failed, or 500
+    for other errors.
+    """
+    def do_GET(self): # pylint: disable=C0103
+        """Answer a query.
+        """
+        client = self.server.client
+        parsed_url = urlparse(self.path)
+        params = {key: value[0] for key, value in
+                  parse_qs(parsed_url.query).items()}
+        fields = params['fields'].split('/') if params.get('fields') else None
+        audit2fa = params.get('audit2fa', '').lower() in ['1', 'true', 'yes']
+        adminonly = params.get('adminonly', '').lower() in ['1', 'true', 'yes']
+
+        path = parsed_url.path.rstrip('/')
+        if path == '/status':
+            self.reply(200, client.status())
+            return
+        if path == '/repos' and (params.get('org') or params.get('user')):
+            records = client.repos(org=params.get('org'),
+                                   user=params.get('user'), fields=fields)
+        elif path == '/members' and (params.get('org') or params.get('team')):
+            records = client.members(org=params.get('org'),
+                                     team=params.get('team'), fields=fields,
+                                     audit2fa=audit2fa, adminonly=adminonly)
+        elif path == '/teams' and params.get('org'):
+            records = client.teams(params['org'], fields=fields)
+        elif path in ['/collabs', '/commits'] and \
+            params.get('owner') and params.get('repo'):
+            if path == '/collabs':
+                records = client.collabs(params['owner'], params['repo'],
+                                         fields=fields, audit2fa=audit2fa)
+            else:
+                records = client.commits(params['owner'], params['repo'],
+                                         fields=fields)
+        elif path in ['/repos', '/members', '/teams', '/collabs', '/commits']:
+            self.reply(400, {'error': 'missing required parameter'})
+            return
+        else:
+            self.reply(404, {'error': 'unknown path: ' + parsed_url.path})
+            return
+
+        try:
+            self.reply(200, [dict(record) for record in
+                             sort_records(records, params.get('sort', ''),
+                                          state=client)])
+        except requests.exceptions.RequestException as err:
+            self.reply(502, {'error': str(err)})
+        except Exception as err: # pylint: disable=W0703
+            # e.g., IncompleteData or unexpected data; the client still gets
+            # a JSON response, and the server keeps running
+            self.reply(500, {'error': type(err).__name__ + ': ' + str(err)})
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        """Log requests to the console if the server is in verbose mode.
+        """
+        if self.server.client.verbose:
+            click.echo(self.address_string() + ' ' + (format % args))
+
+    def reply(self, status, value):
+        """Send a JSON response.
+        """
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def session_config(*, poolsize=10, state=None): #----------------------------<<<
+    """Configure the requests session used for GitHub API calls.
+
+    poolsize = maximum number of connections kept open to the API server,
+               which should be at least the number of threads that call the
+               API concurrently
+    state    = settings object (default _settings)
+
+    Replaces the current session, if any.
+    """
+    if not state:
+        state = _settings
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=poolsize,
+                                            pool_maxsize=poolsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if state.requests_session:
+        state.requests_session.close()
+    state.requests_session = session
+
+def size_bytes(text): #------------------------------------------------------<<<
+    """Convert a size such as '500M' or '2G' to a number of bytes.
+
+    text = number of bytes, with an optional K/M/G/T suffix (powers of 1024)
+
+    Returns the number of bytes, or None if the size isn't valid.
+    """
+    match = re.match(r'^\s*(\d+(\.\d+)?)\s*([KMGT]?)B?\s*$', text.upper())
+    if not match:
+        return None
+    multiplier = 1024 ** ' KMGT'.index(match.group(3) or ' ')
+    return int(float(match.group(1)) * multiplier)
+
+def snapshot_list(folder): #-------------------------------------------------<<<
+    """Get the snapshots in a snapshot folder, oldest first.
+    <internal>
+    """
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.splitext(entry.name)[0] for entry
+                  in os.scandir(folder) if entry.name.endswith('.idx'))
+
+def snapshot_read(fhandle, offset, length): #--------------------------------<<<
+    """Read one record from a snapshot file.
+
+    fhandle = snapshot file (.jsonl), opened in binary mode
+    offset  = byte offset of the record
+    length  = length of the record in bytes
+
+    Returns the record.
+    <internal>
+    """
+    fhandle.seek(offset)
+    return json.loads(fhandle.read(length).decode('utf-8'))
+
+def snapshot_write(filename, payload, keep): #-------------------------------<<<
+    """Save a snapshot of cached data, for use by the diff command.
+
+    filename = the cache filename
+    payload  = the list of dictionaries in the cache file
+    keep     = number of snapshots to keep for this cache file
+
+    The snapshot is a JSON Lines file (one record per line) and an index that
+    maps each record's key (id, or sha for commits) to its hash, offset and
+    length. Snapshots are stored in the <cache file>.snapshots folder, and
+    named for the time they were taken.
+    <internal>
+    """
+    folder = os.path.splitext(filename)[0] + '.snapshots'
+    os.makedirs(folder, exist_ok=True)
+    now = time.time()
+    snapshot = os.path.join(folder,
+                            time.strftime('%Y%m%d-%H%M%S', time.gmtime(now)) +
+                            '.{0:06d}'.format(int(now % 1 * 1000000)))
+
+    index = dict()
+    offset = 0
+    with open(snapshot + '.jsonl', 'wb') as fhandle:
+        for lineno, record in enumerate(payload):
+            line = json.dumps(record, sort_keys=True).encode('utf-8')
+            key = record.get('sha', record.get('id', lineno)) \
+                if isinstance(record, dict) else lineno
+            index[str(key)] = [hashlib.md5(line).hexdigest(), offset, len(line)]
+            fhandle.write(line + b'\n')
+            offset += len(line) + 1
+    with open(snapshot + '.idx', 'w') as fhandle:
+        json.dump(index, fhandle)
+
+    for oldsnapshot in snapshot_list(folder)[:-keep]:
+        remove_path(os.path.join(folder, oldsnapshot + '.idx'))
+        remove_path(os.path.join(folder, oldsnapshot + '.jsonl'))
+
 @cli.command(help='Get team information for an organization')
 @click.option('-o', '--org', default='',
               help='GitHub organization', metavar='<str>')
@@ -1120,18 +4086,47 @@ def reposget(*, org=None, user=None, fields=None): #-------------------------<<<
 @click.option('-s', '--source', default='p',
               help='data source - a/API, c/cache, or p/prompt', metavar='<str>')
 @click.option('-n', '--filename', default='',
-              help='output filename (.CSV or .JSON)', metavar='<str>')
+              help='output filename (.CSV, .JSON or .JSONL)', metavar='<str>')
 @click.option('-f', '--fields', default='',
               help='fields to include', metavar='<str>')
 @click.option('-d', '--display', is_flag=True, default=True,
               help="Don't display retrieved data")
 @click.option('-v', '--verbose', is_flag=True, default=False,
               help="Display verbose status info")
+@click.option('--trace', default='',
+              help='write request trace to a JSON Lines file', metavar='<str>')
+@click.option('--metrics', default='',
+              help='write Prometheus metrics to a textfile', metavar='<str>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--sort', default='',
+              help='sort fields, e.g. name or -created_at,name', metavar='<str>')
+@click.option('--display-limit', 'displaylimit', default=0,
+              help='max records to display (0 = all)', metavar='<int>')
+@click.option('--pager', is_flag=True, default=False,
+              help='display data through a pager')
+@click.option('-e', '--expand', default='',
+              help='add members and/or repos of each team, e.g. members,repos',
+              metavar='<str>')
+@click.option('-w', '--workers', default=8,
+              help='team members/repos retrieved concurrently for --expand',
+              metavar='<int>')
+@click.option('--count', is_flag=True, default=False,
+              help='display the number of teams instead of retrieving them')
 @click.option('-l', '--listfields', is_flag=True,
               help='list available fields and exit.')
 def teams(org, authuser, source, filename, fields, #-------------------------<<<
-          display, verbose, listfields):
+          display, verbose, trace, metrics, snapshots, sort,
+          displaylimit, pager, expand, workers, count, listfields):
     """get team information for an organization.
+
+    If --expand is specified, each team's members (list of logins) and/or
+    repos (dictionary of repo full name to the team's highest permission)
+    are added to the team's record, retrieving up to <workers> endpoints at
+    a time. These are nested in .JSON/.JSONL output files; the console and
+    .CSV output have one row per team member and per team repo (see
+    teamsrows).
     """
     if listfields:
         list_fields('team')
@@ -1143,29 +4138,370 @@ def teams(org, authuser, source, filename, fields, #-------------------------<<<
         return
     if not filename_valid(filename):
         return
+    expand = [child.strip().lower() for child in expand.split(',')
+              if child.strip()]
+    if not set(expand) <= {'members', 'repos'}:
+        click.echo('ERROR: --expand must be members, repos or members,repos')
+        return
 
     start_time = default_timer()
 
     # store settings in _settings
     _settings.display_data = display
+    _settings.display_limit = displaylimit
+    _settings.display_pager = pager
     _settings.verbose = verbose
     source = source if source else 'p'
     _settings.datasource = source.lower()[0]
+    if trace:
+        trace_file(trace)
+    if metrics:
+        metrics_config(filename=metrics)
+    _settings.snapshot_keep = snapshots
 
     # retrieve requested data
     auth_config({'username': authuser})
     fldnames = fields.split('/') if fields else None
-    templist = github_data(
-        endpoint='/orgs/' + org + '/teams?per_page=100', entity='team',
-        fields=fldnames, constants={"org": org}, headers={})
+    if count:
+        data_counts([({'org': org}, endpoint_spec('team', org=org))], filename)
+        elapsed_time(start_time)
+        return
+    if expand:
+        if _settings.datasource not in ['a', 'c']:
+            # prompt once for the teams and all of their members/repos
+            _settings.datasource = click.prompt(
+                'Read from API (a), cache (c) or exit (x)?').lower()[:1]
+            if _settings.datasource not in ['a', 'c']:
+                return
+        templist = teamsexpand(org=org, fields=fldnames, expand=expand,
+                               workers=workers)
+        sorted_data = sort_records(templist, sort)
+        data_display(teamsrows(sorted_data, expand))
+        if os.path.splitext(filename)[1].lower() in ['.json', '.jsonl']:
+            data_write(filename, sorted_data)
+        else:
+            data_write(filename, teamsrows(sorted_data, expand))
+        elapsed_time(start_time)
+        return
+    else:
+        templist = github_data(
+            endpoint='/orgs/' + org + '/teams?per_page=100', entity='team',
+            fields=fldnames, constants={"org": org}, headers={})
 
     # handle returned data
-    sorted_data = sorted(templist, key=data_sort)
+    sorted_data = sort_records(templist, sort)
     data_display(sorted_data)
     data_write(filename, sorted_data)
 
     elapsed_time(start_time)
 
+def teamsexpand(*, org=None, fields=None, expand=None, workers=8): #---------<<<
+    """Get teams for an organization, with the members and/or repos of each
+    team.
+
+    org     = organization name
+    fields  = list of team fields to be returned
+    expand  = list of child data to add to each team: 'members', 'repos'
+    workers = maximum number of team members/repos endpoints retrieved at the
+              same time
+
+    The child endpoints are retrieved concurrently by github_data() in worker
+    threads, over a session with a connection pool sized for the workers. If
+    _settings.datasource is 'c', child endpoints that have no cached data are
+    treated as empty.
+
+    Returns a list of Records, one per team, with the team fields plus a
+    'members' field (list of logins) and/or a 'repos' field (dictionary of
+    repo full name -> the team's highest permission: admin, push or pull).
+    """
+    teamdata = github_data(**endpoint_spec('team', org=org), fields=['*'])
+    if not fields:
+        fields = default_fields('team')
+    children = {'members': ('member', ['login']),
+                'repos': ('repo', ['full_name', 'permissions.admin',
+                                   'permissions.push', 'permissions.pull'])}
+
+    session_config(poolsize=max(workers, 10))
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = dict()
+        for team in teamdata:
+            for child in expand:
+                entity, childfields = children[child]
+                spec = endpoint_spec(entity, org=org, team=team['id'])
+                if _settings.datasource == 'c' and \
+                    not cache_exists(spec['endpoint']):
+                    continue
+                futures[(team['id'], child)] = executor.submit(
+                    github_data, fields=childfields, **spec)
+
+        templist = []
+        for team in teamdata:
+            values = dict(data_fields(entity='team', jsondata=dict(team),
+                                      fields=fields, constants={'org': org}))
+            for child in expand:
+                future = futures.get((team['id'], child))
+                childdata = future.result() if future else []
+                if child == 'members':
+                    values['members'] = [member['login'] for member in childdata]
+                else:
+                    values['repos'] = {
+                        repo['full_name']: next(
+                            (permission for permission in ['admin', 'push', 'pull']
+                             if repo['permissions_' + permission]), '')
+                        for repo in childdata}
+            templist.append(record_class(tuple(values))(values.values()))
+    return templist
+
+def teamsrows(teamdata, expand): #-------------------------------------------<<<
+    """Generator that denormalizes the teams returned by teamsexpand(), for
+    CSV and console output.
+
+    teamdata = list of Records returned by teamsexpand()
+    expand   = list of child data in the Records: 'members', 'repos'
+
+    Yields one Record per team member and per team repo, with the team's
+    fields plus a member field (if expanding members) and/or repo and
+    permission fields (if expanding repos); the fields that don't apply to a
+    row are empty. A team with no members or repos has one row.
+    <internal>
+    """
+    blankmember = [''] if 'members' in expand else []
+    blankrepo = ['', ''] if 'repos' in expand else []
+    rowclass = None
+    for team in teamdata:
+        values = [value for fldname, value in team.items()
+                  if fldname not in ['members', 'repos']]
+        if rowclass is None:
+            rowclass = record_class(
+                tuple(fldname for fldname in team
+                      if fldname not in ['members', 'repos']) +
+                (('member',) if 'members' in expand else ()) +
+                (('repo', 'permission') if 'repos' in expand else ()))
+        children = [[login] + blankrepo for login in team.get('members', [])]
+        children.extend(blankmember + [repo, permission] for repo, permission
+                        in team.get('repos', {}).items())
+        for child in children if children else [blankmember + blankrepo]:
+            yield rowclass(values + child)
+
+def sort_chunk(iterator, state=None): #--------------------------------------<<<
+    """Get the next records to be sorted in memory by sort_records().
+
+    iterator = iterator of records
+    state    = settings object containing sort_memory (default _settings)
+
+    Returns a list of the next records from the iterator, up to an
+    approximate size of state.sort_memory bytes (at least one record,
+    unless the iterator is exhausted).
+    <internal>
+    """
+    if not state:
+        state = _settings
+    chunk = []
+    size = 0
+    for record in iterator:
+        chunk.append(record)
+        size += sort_size(record)
+        if size >= state.sort_memory:
+            break
+    return chunk
+
+def sort_key(sortspec=None, fieldnames=None): #------------------------------<<<
+    """Get a key function for sorting records.
+
+    sortspec   = comma-separated field names, each optionally prefixed with -
+                 for descending order (e.g., '-created_at,name'); dot notation
+                 may be used for nested fields (e.g., 'owner.login'). If not
+                 specified, records are sorted by their first field.
+    fieldnames = the records' field names, used for the default sort and to
+                 log unknown sort fields in _settings.unknownfieldname
+
+    Returns a function that takes a record and returns its sort key. Values
+    are compared by type: None first, then numbers (including numeric strings
+    such as team IDs), then dates/times in ISO 8601 format, then other strings
+    (case-insensitive).
+    <internal>
+    """
+    if sortspec:
+        sortfields = [(fldname.lstrip('-+').replace('.', '_'),
+                       fldname.startswith('-'))
+                      for fldname in sortspec.split(',') if fldname.strip('-+')]
+    else:
+        sortfields = [(fieldnames[0], False)] if fieldnames else []
+
+    if fieldnames:
+        for fldname, _ in sortfields:
+            if fldname not in fieldnames:
+                _settings.unknownfieldname.add(fldname)
+
+    def value_key(value):
+        """Get a typed sort key for a single value.
+        """
+        if value is None:
+            return (0, 0)
+        if isinstance(value, (bool, int, float)):
+            return (1, value)
+        value = str(value)
+        if value.isdigit():
+            return (1, int(value))
+        if SORT_ISODATE.match(value):
+            try:
+                timestamp = datetime.datetime.fromisoformat(
+                    value.replace('Z', '+00:00'))
+                if not timestamp.tzinfo:
+                    timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+                return (2, timestamp.timestamp())
+            except ValueError:
+                pass
+        return (3, value.lower())
+
+    def record_key(record):
+        """Get the sort key for a record.
+        """
+        return tuple(SortDescending(value_key(record.get(fldname)))
+                     if descending else value_key(record.get(fldname))
+                     for fldname, descending in sortfields)
+
+    return record_key
+
+def sort_records(records, sortspec=None, state=None): #----------------------<<<
+    """Sort records by one or more fields.
+
+    records  = list (or other iterable) of dictionaries
+    sortspec = sort fields, as described in sort_key(); default is to sort
+               by the first field
+    state    = settings object containing sort_memory (default _settings)
+
+    Sort keys are computed once per record. Records are read from the
+    iterable as they're sorted, so callers should pass a generator rather
+    than a list where possible. If the records take more memory than
+    state.sort_memory bytes (approximately, see sort_size), they are
+    sorted in runs of that size which are written to temporary files and
+    merged (an external merge sort), and a SortedRuns object is returned;
+    otherwise returns a sorted list.
+    """
+    if not state:
+        state = _settings
+    iterator = iter(records)
+    chunk = sort_chunk(iterator, state)
+    if not chunk:
+        return []
+    keyfunc = sort_key(sortspec, list(chunk[0].keys()))
+
+    decorated = [(keyfunc(record), record) for record in chunk]
+    decorated.sort(key=operator.itemgetter(0))
+    chunk = sort_chunk(iterator, state)
+    if not chunk:
+        return [record for _, record in decorated] # sorted in memory
+
+    runs = SortedRuns()
+    runs.add(decorated)
+    while chunk:
+        decorated = [(keyfunc(record), record) for record in chunk]
+        decorated.sort(key=operator.itemgetter(0))
+        runs.add(decorated)
+        chunk = sort_chunk(iterator, state)
+    if state.verbose:
+        click.echo('External sort: ', nl=False)
+        click.echo(click.style(str(len(runs)) + ' records in ' +
+                               str(len(runs.runfiles)) + ' runs', fg='cyan'))
+    return runs
+
+def sort_size(record): #-----------------------------------------------------<<<
+    """Get the approximate memory used by a record, in bytes.
+
+    record = dictionary or Record
+
+    Counts the record and its values, but not the contents of nested
+    dictionaries or lists.
+    <internal>
+    """
+    return sys.getsizeof(record) + \
+        sum(sys.getsizeof(value) for value in record.values())
+
+class SortDescending: #------------------------------------------------------<<<
+    """Wrapper for a sort key value that reverses its sort order.
+    """
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __reduce__(self):
+        return (SortDescending, (self.value,))
+
+class SortedRuns: #----------------------------------------------------------<<<
+    """Sorted runs of records in temporary files, from sort_records().
+
+    Iterating over this object merges the runs, returning the records in sort
+    order. It can be iterated more than once (e.g., to display the records and
+    then write them to an output file). The temporary files are deleted when
+    the object is garbage-collected.
+    """
+    def __init__(self):
+        self.tempfolder = tempfile.TemporaryDirectory(prefix='gitdata-sort-')
+        self.runfiles = [] # temporary filenames, each containing a sorted run
+        self.count = 0 # total number of records
+
+    def __iter__(self):
+        readers = [self.read(runfile) for runfile in self.runfiles]
+        for _, record in heapq.merge(*readers, key=operator.itemgetter(0)):
+            yield record
+
+    def __len__(self):
+        return self.count
+
+    def add(self, decorated):
+        """Write a sorted run of (key, record) tuples to a temporary file.
+        """
+        runfile = os.path.join(self.tempfolder.name,
+                               'run' + str(len(self.runfiles)))
+        with open(runfile, 'wb') as fhandle:
+            for item in decorated:
+                pickle.dump(item, fhandle, pickle.HIGHEST_PROTOCOL)
+        self.runfiles.append(runfile)
+        self.count += len(decorated)
+
+    @staticmethod
+    def read(runfile):
+        """Generator that returns the (key, record) tuples in a run.
+        """
+        with open(runfile, 'rb') as fhandle:
+            while True:
+                try:
+                    yield pickle.load(fhandle)
+                except EOFError:
+                    return
+
+class ThreadSettings: #------------------------------------------------------<<<
+    """Settings object for a worker thread: the same settings as another
+    settings object, but with its own requests session.
+
+    state = the settings object (e.g., _settings) whose other values are read
+            and updated
+
+    requests.Session objects aren't guaranteed to be thread-safe, so each
+    worker thread that calls the API should use one of these objects as its
+    state. The API call totals are updated under the shared totals_lock.
+    """
+    def __init__(self, state):
+        object.__setattr__(self, 'state', state)
+        object.__setattr__(self, 'requests_session', None)
+
+    def __getattr__(self, name):
+        return getattr(self.state, name)
+
+    def __setattr__(self, name, value):
+        if name == 'requests_session':
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.state, name, value)
+
 def token_abbr(accesstoken): #-----------------------------------------------<<<
     """Get abbreviated access token (for display purposes).
 
@@ -1177,6 +4513,354 @@ def token_abbr(accesstoken): #-----------------------------------------------<<<
     else:
         return "*none*"
 
+def trace_addhook(hook, state=None): #---------------------------------------<<<
+    """Register a function to be called for each trace event.
+
+    hook = function that takes one parameter, a dictionary containing these
+           values for each event:
+           event = 'request' (API call or cache read), 'parse' (JSON decoding
+                   of a page), 'cache_write' (cache update), 'projection'
+                   (extracting fields), 'output' (console display or output
+                   file), or 'elapsed' (command completed)
+           timestamp = time of the event (seconds since the epoch)
+           seconds = duration of the request or processing step
+           'request' events also include endpoint, page, status, bytes,
+           cache ('hit', 'memo', 'coalesced' or 'miss') and
+           ratelimit_remaining.
+    state = settings object to register the hook in (default _settings)
+
+    Returns the hook function, for use with trace_removehook().
+    """
+    if not state:
+        state = _settings
+    state.request_hooks.append(hook)
+    return hook
+
+def trace_event(event, *, state=None, **values): #---------------------------<<<
+    """Send a trace event to the registered hook functions.
+
+    event  = event type (see trace_addhook() for details)
+    state  = settings object containing the hooks (default _settings)
+    values = the event's values, as keyword arguments
+
+    Does nothing if no hooks are registered.
+    <internal>
+    """
+    if not state:
+        state = _settings
+    if not state.request_hooks:
+        return
+
+    eventdict = {'event': event, 'timestamp': round(time.time(), 6)}
+    eventdict.update(values)
+    if 'seconds' in eventdict:
+        eventdict['seconds'] = round(eventdict['seconds'], 6)
+    for hook in list(state.request_hooks):
+        hook(eventdict)
+
+def trace_file(filename, state=None): #--------------------------------------<<<
+    """Write trace events to a JSON Lines file.
+
+    filename = name of the trace file; overwritten if it already exists
+    state    = settings object to register the hook in (default _settings)
+
+    Each trace event is written as a line of JSON. Returns the hook function,
+    for use with trace_removehook().
+    """
+    fhandle = open(filename, 'w', buffering=1) # line-buffered
+    lock = threading.Lock()
+
+    def write_event(eventdict):
+        """Hook function that writes one event to the trace file.
+        """
+        with lock:
+            fhandle.write(json.dumps(eventdict) + '\n')
+    write_event.close = fhandle.close
+
+    return trace_addhook(write_event, state)
+
+def trace_removehook(hook, state=None): #------------------------------------<<<
+    """Remove a hook function registered with trace_addhook() or trace_file().
+
+    state = settings object the hook was registered in (default _settings)
+
+    If the hook writes to a trace file, the file is closed.
+    """
+    if not state:
+        state = _settings
+    if hook in state.request_hooks:
+        state.request_hooks.remove(hook)
+    if hasattr(hook, 'close'):
+        hook.close()
+
+def usage_counts(days=30, state=None): #-------------------------------------<<<
+    """Summarize the usage log (see usage_record).
+
+    days  = number of days of usage to include
+    state = settings object (default _settings)
+
+    Returns a tuple of two dictionaries, keyed by cache filename: the number
+    of times data was read in the specified number of days, and the number of
+    API calls used by the most recent warm refresh.
+    """
+    reads = collections.Counter()
+    pages = dict()
+    cutoff = time.time() - days * 86400
+    try:
+        with open(usage_logfile(state), 'r') as fhandle:
+            for line in fhandle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # partially written line
+                if entry['timestamp'] < cutoff:
+                    continue
+                if entry.get('pages') is not None:
+                    pages[entry['cachefile']] = entry['pages']
+                else:
+                    reads[entry['cachefile']] += 1
+    except FileNotFoundError:
+        pass
+    return (reads, pages)
+
+def usage_logfile(state=None): #---------------------------------------------<<<
+    """Get the filename of the usage log, which is in the cache folder.
+    <internal>
+    """
+    return os.path.join(cache_root(state), '_usage.jsonl')
+
+def usage_prune(days=30, state=None): #--------------------------------------<<<
+    """Remove entries older than the specified number of days from the usage
+    log, so that it doesn't grow without bound. If the remaining entries take
+    more than half of USAGE_MAXSIZE bytes, only the most recent entries that
+    fit in that size are kept.
+    <internal>
+    """
+    filename = usage_logfile(state)
+    cutoff = time.time() - days * 86400
+    try:
+        with open(filename, 'r') as fhandle:
+            lines = [line for line in fhandle if line.endswith('\n') and
+                     json.loads(line)['timestamp'] >= cutoff]
+    except (FileNotFoundError, ValueError):
+        return
+    size = 0
+    for lineno in range(len(lines) - 1, -1, -1):
+        size += len(lines[lineno])
+        if size > USAGE_MAXSIZE // 2:
+            lines = lines[lineno + 1:]
+            break
+    tempname = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(tempname, 'w') as fhandle:
+        fhandle.writelines(lines)
+    os.replace(tempname, filename)
+
+def usage_record(endpoint, pages=None, state=None): #------------------------<<<
+    """Record the use of an endpoint in the usage log.
+
+    endpoint = the API endpoint
+    pages    = number of API calls used, for a refresh by the warm command
+               (None = data was requested by a user)
+    state    = settings object (default _settings)
+
+    The usage log is a JSON Lines file in the cache folder, used by the warm
+    command to prioritize endpoints. When it's larger than USAGE_MAXSIZE bytes,
+    old entries are removed. Errors writing to it are ignored.
+    <internal>
+    """
+    entry = {'cachefile': os.path.basename(cache_filename(endpoint, state=state)),
+             'timestamp': round(time.time(), 3)}
+    if pages is not None:
+        entry['pages'] = pages
+    try:
+        os.makedirs(cache_root(state), exist_ok=True)
+        with open(usage_logfile(state), 'a') as fhandle:
+            fhandle.write(json.dumps(entry) + '\n')
+            logsize = fhandle.tell()
+        if logsize > USAGE_MAXSIZE:
+            usage_prune(state=state)
+    except OSError:
+        pass
+
+@cli.command(help='Refresh cached data listed in a manifest file')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('-a', '--authuser', default='',
+              help='authentication username', metavar='<str>')
+@click.option('-b', '--budget', default=1000,
+              help='maximum number of API calls to use', metavar='<int>')
+@click.option('-m', '--minage', default=60,
+              help='skip cached data updated in the last <int> minutes',
+              metavar='<int>')
+@click.option('--snapshots', default=0,
+              help='save a snapshot of updated cache files for diff, '
+              'keeping the last <int>', metavar='<int>')
+@click.option('--dryrun', is_flag=True, default=False,
+              help='display the refresh plan without calling the API '
+              '(-o * uses the cached list of orgs)')
+@click.option('-v', '--verbose', is_flag=True, default=False,
+              help='display each refreshed endpoint')
+def warm(manifest, authuser, budget, minage, snapshots, #--------------------<<<
+         dryrun, verbose):
+    """Refresh the cached data for the endpoints in a manifest file.
+
+    Each line of the manifest is a gitdata command with its options (for
+    example, 'repos -o myorg', 'members -o *' or 'collabs -o me -r myrepo'),
+    or an API endpoint (for example, '/orgs/myorg/teams?per_page=100').
+    Blank lines and lines beginning with # are ignored.
+
+    Endpoints are refreshed in priority order (age of the cached data times
+    the number of times it has been used in the last 30 days), until the
+    budget or the remaining API rate limit is used up.
+    """
+    start_time = default_timer()
+    _settings.verbose = False
+    # in a dry run, the org lists for -o * are read from the cache
+    _settings.datasource = 'c' if dryrun else 'a'
+    _settings.snapshot_keep = snapshots
+    auth_config({'username': authuser})
+
+    with open(manifest, 'r') as fhandle:
+        lines = [line.strip() for line in fhandle]
+    targets = dict() # key = cache filename, value = endpoint_spec() dict
+    for line in lines:
+        if not line or line.startswith('#'):
+            continue
+        for target in warm_targets(line, authuser):
+            targets.setdefault(cache_filename(target['endpoint']), target)
+
+    # prioritize the targets, skipping those updated recently
+    reads, pages = usage_counts()
+    now = time.time()
+    plan = []
+    for filename, target in targets.items():
+        if cache_exists(target['endpoint']):
+            age = now - os.path.getmtime(filename)
+        else:
+            age = 30 * 86400 # no cached data, so treat as 30 days old
+        if age < minage * 60:
+            continue
+        nameonly = os.path.basename(filename)
+        priority = (age / 3600) * (1 + reads[nameonly])
+        plan.append((priority, pages.get(nameonly, 1), target))
+    plan.sort(key=lambda item: item[0], reverse=True)
+
+    # the budget is limited to the remaining API rate limit
+    if not dryrun:
+        response = github_api(endpoint='/rate_limit', auth=auth_user())
+        try:
+            budget = min(budget,
+                         response.json()['resources']['core']['remaining'])
+        except (KeyError, TypeError, ValueError):
+            pass # rate limit not available, so use the specified budget
+
+    refreshed = skipped = failed = used = 0
+    for priority, estimate, target in plan:
+        if used + estimate > budget:
+            skipped += 1
+            continue
+        if dryrun or verbose:
+            click.echo('{0:10.1f} '.format(priority) + target['endpoint'])
+        if dryrun:
+            used += estimate
+            continue
+        calls_before = _settings.tot_api_calls
+        try:
+            payload = github_allpages(endpoint=target['endpoint'],
+                                      auth=auth_user(),
+                                      headers=target['headers'],
+                                      maxpages=budget - used)
+        except IncompleteData as err:
+            # don't save partial data
+            if err.response is None:
+                skipped += 1 # more pages than the remaining budget
+            else:
+                failed += 1
+        else:
+            cache_update(target['endpoint'], payload, target['constants'])
+            usage_record(target['endpoint'],
+                         pages=_settings.tot_api_calls - calls_before)
+            refreshed += 1
+        used += _settings.tot_api_calls - calls_before
+
+    if not dryrun:
+        usage_prune()
+    click.echo('Endpoints ' + ('to refresh: ' if dryrun else 'refreshed: '),
+               nl=False)
+    click.echo(click.style(str(len(plan) - skipped) if dryrun else
+                           str(refreshed), fg='cyan'))
+    click.echo('Up to date: ', nl=False)
+    click.echo(click.style(str(len(targets) - len(plan)), fg='cyan'))
+    click.echo('Over budget: ', nl=False)
+    click.echo(click.style(str(skipped), fg='cyan'))
+    if failed:
+        click.echo('Failed: ', nl=False)
+        click.echo(click.style(str(failed), fg='cyan'))
+    click.echo('API calls: ', nl=False)
+    click.echo(click.style(str(used) + (' (estimated)' if dryrun else ''),
+                           fg='cyan'))
+
+    _settings.verbose = verbose
+    elapsed_time(start_time)
+
+def warm_targets(line, authname=None): #-------------------------------------<<<
+    """Get the endpoints for a line of a warm manifest.
+
+    line     = a gitdata command and options, or an API endpoint
+    authname = authentication username, for -o * (all orgs for this user)
+
+    Returns a list of endpoint_spec() dictionaries.
+    <internal>
+    """
+    tokens = shlex.split(line)
+    if tokens[0].startswith('/'):
+        return [{'endpoint': tokens[0], 'entity': None, 'constants': None,
+                 'headers': {}}]
+
+    entity = {'collabs': 'collab', 'commits': 'commit', 'members': 'member',
+              'orgs': 'org', 'repos': 'repo', 'teams': 'team'}.get(tokens[0])
+    if not entity:
+        click.echo('ERROR: unknown manifest entry: ' + line)
+        return []
+
+    options = {'audit2fa': False, 'adminonly': False}
+    option_names = {'-o': 'org', '--org': 'org', '--owner': 'org',
+                    '-u': 'user', '--user': 'user', '-t': 'team',
+                    '--team': 'team', '-r': 'repo', '--repo': 'repo'}
+    tokens = tokens[1:]
+    while tokens:
+        token = tokens.pop(0)
+        if token in ['--audit2fa', '--adminonly']:
+            options[token[2:]] = True
+        elif token in option_names and tokens:
+            options[option_names[token]] = tokens.pop(0)
+        elif token[:2] in option_names and len(token) > 2:
+            options[option_names[token[:2]]] = token[2:] # e.g., -omyorg
+        else:
+            click.echo('ERROR: unknown option in manifest entry: ' + line)
+            return []
+
+    if entity in ['collab', 'commit']:
+        options['owner'] = options.pop('org', None)
+        if not options['owner'] or not options.get('repo'):
+            click.echo('ERROR: owner and repo required: ' + line)
+            return []
+    if entity == 'org':
+        return [endpoint_spec('org', authname=authname)]
+
+    required = {'member': ['org', 'team'], 'repo': ['org', 'user'],
+                'team': ['org']}.get(entity, [])
+    if required and not any(options.get(name) for name in required):
+        click.echo('ERROR: ' + ' or '.join(required) + ' required: ' + line)
+        return []
+    if options.get('org') == '*':
+        if not authname:
+            click.echo('ERROR: -a option required for org=* syntax.')
+            return []
+        return [endpoint_spec(entity, **dict(options, org=orgname))
+                for orgname in orglist(authname)]
+
+    return [endpoint_spec(entity, **options)]
+
 def wildcard_fields(): #-----------------------------------------------------<<<
     """Display wildcard field options.
     """
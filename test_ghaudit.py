@@ -0,0 +1,71 @@
+"""Tests for ghaudit.py
+"""
+import os
+import time
+
+import ghaudit
+
+def test_linkindex_rebuilt(monkeypatch, tmpdir):
+    """The linking data index is rebuilt when linkdata.csv is newer than it.
+    """
+    monkeypatch.chdir(tmpdir)
+    os.mkdir('ghaudit')
+    with open('ghaudit/linkdata.csv', 'w') as fhandle:
+        fhandle.write('githubuser,email\nAlice,alice@example.com\n')
+    connection = ghaudit.linkindex()
+    assert connection.execute('SELECT login, email FROM links').fetchall() == \
+        [('alice', 'alice@example.com')]
+    connection.close()
+
+    with open('ghaudit/linkdata.csv', 'w') as fhandle:
+        fhandle.write('githubuser,email\nBob,bob@example.com\n')
+    earlier = os.path.getmtime('ghaudit/linkdata.csv') - 10
+    os.utime('ghaudit/linkdata.db', (earlier, earlier))
+    connection = ghaudit.linkindex()
+    assert connection.execute('SELECT login, email FROM links').fetchall() == \
+        [('bob', 'bob@example.com')]
+    connection.close()
+
+    # not rebuilt if the CSV file hasn't changed
+    dbtime = os.path.getmtime('ghaudit/linkdata.db')
+    time.sleep(0.01)
+    ghaudit.linkindex().close()
+    assert os.path.getmtime('ghaudit/linkdata.db') == dbtime
+
+def test_accessmatrix(monkeypatch, tmpdir):
+    """The access model has each user's highest permission for each repo,
+    from team and collaborator access, and the org-level outside
+    collaborators.
+    """
+    monkeypatch.chdir(tmpdir)
+    os.mkdir('ghaudit')
+    fixtures = {
+        'teammembers.csv': 'teamid,login,type,site_admin,linked\n'
+                           '1,Alice,User,False,True\n'
+                           '2,alice,User,False,True\n'
+                           '2,bob,User,False,False\n',
+        'repoteams.csv': 'org,repo,teamid,admin,push,pull\n'
+                         'org1,repo1,1,False,False,True\n'
+                         'org1,repo1,2,False,True,True,extra\n'
+                         'org1,repo2,2,False,False,False\n',
+        'collabs.csv': 'org,repo,collaborator,permission\n'
+                       'org1,,Carol,\n'
+                       'org1,repo2,carol,admin\n'
+                       'org1,repo1,bob,pull\n',
+        'orgmembers.csv': 'org,login,type,site_admin,linked\n'
+                          'org1,alice,User,False,True\n'
+                          'org1,bob,User,False,False\n'}
+    for filename, text in fixtures.items():
+        with open('ghaudit/' + filename, 'w') as fhandle:
+            fhandle.write(text)
+
+    monkeypatch.delattr(ghaudit.gd._settings, 'accessmatrix', raising=False)
+    try:
+        assert ghaudit.accessrepos('ALICE') == [('org1/repo1', 'push')]
+        assert ghaudit.accessrepos('carol') == [('org1/repo2', 'admin')]
+        assert ghaudit.accessusers('org1/repo1', 'push') == ['alice', 'bob']
+        assert ghaudit.accessusers('org1/repo2') == ['carol']
+        assert ghaudit.outsideadmins() == [('carol', 'org1/repo2')]
+        assert ghaudit.accessmatrix()['outsidecollabs'] == {'org1': {'carol'}}
+    finally:
+        del ghaudit.gd._settings.accessmatrix
@@ -0,0 +1,551 @@
+"""Tests for gitdata.py
+"""
+import csv
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+from click.testing import CliRunner
+
+import gitdata
+
+def test_cache_records_streamed(monkeypatch, tmpdir):
+    """Narrow reads from the cache should stream the records via
+    cache_records() instead of loading the whole cache file.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    payload = [{'name': 'repo-{0}'.format(n), 'id': n,
+                'owner': {'login': 'org1'}} for n in range(3)]
+    gitdata.cache_update('/orgs/org1/repos', payload, None, state=client)
+
+    calls = []
+    cache_records = gitdata.cache_records
+    def spy(filename, fields):
+        calls.append(fields)
+        return cache_records(filename, fields)
+    monkeypatch.setattr(gitdata, 'cache_records', spy)
+
+    records = list(client.repos(org='org1', fields=['name', 'owner.login']))
+    assert calls == [['name', 'owner.login']]
+    assert [record['name'] for record in records] == \
+        ['repo-0', 'repo-1', 'repo-2']
+    assert records[0]['owner_login'] == 'org1'
+
+def test_memo_cache_reads(monkeypatch, tmpdir):
+    """With the in-memory cache enabled, narrow cache reads are still
+    streamed, and a second read of the same data doesn't read the cache file.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    gitdata.memo_config(state=client)
+    gitdata.cache_update('/orgs/org1/repos', [{'name': 'repo-0', 'id': 0}],
+                         None, state=client)
+
+    calls = []
+    cache_records = gitdata.cache_records
+    def spy(filename, fields):
+        calls.append(fields)
+        return cache_records(filename, fields)
+    monkeypatch.setattr(gitdata, 'cache_records', spy)
+
+    first = list(client.repos(org='org1', fields=['name']))
+    assert calls == [['name']]
+
+    def noio(*args, **kwargs):
+        raise AssertionError('cache file read')
+    monkeypatch.setattr(gitdata, 'cache_records', noio)
+    monkeypatch.setattr(gitdata, 'read_json', noio)
+    second = list(client.repos(org='org1', fields=['name']))
+    assert second == first
+    assert [record['name'] for record in second] == ['repo-0']
+    assert client.memo.hits == 1
+
+def test_memo_api_reads(monkeypatch, tmpdir):
+    """With the in-memory cache enabled, a second request for an endpoint
+    doesn't call the API or read the cache file.
+    """
+    client = gitdata.GitData(source='a', cache_folder=str(tmpdir))
+    gitdata.memo_config(state=client)
+    endpoints = []
+    def github_api(*, endpoint=None, auth=None, headers=None, state=None):
+        endpoints.append(endpoint)
+        return FakeResponse([{'login': 'org1'}, {'login': 'org2'}])
+    monkeypatch.setattr(gitdata, 'github_api', github_api)
+
+    first = list(client.orgs(fields=['login']))
+    monkeypatch.setattr(gitdata, 'read_json', None)
+    second = list(client.orgs(fields=['login']))
+    assert endpoints == ['/user/orgs']
+    assert [record['login'] for record in second] == ['org1', 'org2']
+    assert second == first
+
+def test_records_streamed_pages(monkeypatch, tmpdir):
+    """Records are yielded as each page is retrieved, the cache is updated
+    after the last page, and two generators for the same endpoint can be
+    iterated together in one thread.
+    """
+    client = gitdata.GitData(source='a', cache_folder=str(tmpdir))
+    gitdata.memo_config(maxsize=0, state=client) # coalescing only
+    endpoints = []
+    def github_api(*, endpoint=None, auth=None, headers=None, state=None):
+        endpoints.append(endpoint)
+        if endpoint.endswith('page=2'):
+            return FakeResponse([{'name': 'repo2'}])
+        return FakeResponse([{'name': 'repo1'}], links={
+            'next': {'url': '/orgs/org1/repos?per_page=100&page=2'}})
+    monkeypatch.setattr(gitdata, 'github_api', github_api)
+
+    records = client.repos(org='org1', fields=['name'])
+    assert next(records)['name'] == 'repo1'
+    assert len(endpoints) == 1
+    assert not gitdata.cache_exists('/orgs/org1/repos?per_page=100',
+                                    state=client)
+    assert [record['name'] for record in records] == ['repo2']
+    assert len(endpoints) == 2
+    assert gitdata.cache_exists('/orgs/org1/repos?per_page=100', state=client)
+
+    pairs = list(zip(client.repos(org='org1', fields=['name']),
+                     client.repos(org='org1', fields=['name'])))
+    assert [(first['name'], second['name']) for first, second in pairs] == \
+        [('repo1', 'repo1'), ('repo2', 'repo2')]
+    assert client.inflight == {}
+
+class FakeResponse:
+    """Stand-in for a requests Response object from github_api().
+    """
+    def __init__(self, payload, status_code=200, links=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.links = links or {}
+        self.url = 'https://api.github.com/'
+
+    def json(self):
+        """Return the payload.
+        """
+        return self.payload
+
+def test_data_write_json_format(tmpdir):
+    """Records are written to .json files in the same format as dicts2json():
+    indented 4 spaces, with sorted keys.
+    """
+    rowclass = gitdata.record_class(('name', 'id', 'owner'))
+    records = [rowclass(['repo-1', 1, {'login': 'org1', 'id': 9}]),
+               rowclass(['repo-0', 0, None])]
+    filename = str(tmpdir.join('out.json'))
+    gitdata.data_write(filename, records)
+    with open(filename) as fhandle:
+        assert fhandle.read() == json.dumps([dict(record) for record in records],
+                                            indent=4, sort_keys=True)
+
+def test_teams_expand_csv(monkeypatch, tmpdir):
+    """teams --expand writes one parseable CSV row per team member and per
+    team repo, and nests the members and repos in JSON output.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    gitdata.cache_update('/orgs/org1/teams?per_page=100',
+                         [{'name': 'team1', 'id': 1, 'privacy': 'closed',
+                           'permission': 'pull'},
+                          {'name': 'team2', 'id': 2, 'privacy': 'closed',
+                           'permission': 'pull'}], None)
+    gitdata.cache_update('/teams/1/members?per_page=100',
+                         [{'login': 'alice'}, {'login': 'bob'}], None)
+    gitdata.cache_update('/teams/1/repos?per_page=100',
+                         [{'full_name': 'org1/repo1',
+                           'permissions': {'admin': False, 'push': True,
+                                           'pull': True}}], None)
+
+    csvfile = str(tmpdir.join('teams.csv'))
+    jsonfile = str(tmpdir.join('teams.json'))
+    runner = CliRunner()
+    for filename in [csvfile, jsonfile]:
+        result = runner.invoke(gitdata.cli, [
+            'teams', '-o', 'org1', '-sc', '-e', 'members,repos', '-d',
+            '-fname/id', '-n', filename])
+        assert result.exit_code == 0, result.output
+
+    with open(csvfile, newline='') as fhandle:
+        rows = list(csv.reader(fhandle))
+    assert rows == [['name', 'id', 'member', 'repo', 'permission'],
+                    ['team1', '1', 'alice', '', ''],
+                    ['team1', '1', 'bob', '', ''],
+                    ['team1', '1', '', 'org1/repo1', 'push'],
+                    ['team2', '2', '', '', '']]
+    with open(jsonfile) as fhandle:
+        teams = json.load(fhandle)
+    assert teams[0]['members'] == ['alice', 'bob']
+    assert teams[0]['repos'] == {'org1/repo1': 'push'}
+    assert teams[1]['members'] == [] and teams[1]['repos'] == {}
+
+def test_metrics_text(tmpdir):
+    """Trace events sent for a GitData object update that object's metrics,
+    which are returned in the Prometheus text format.
+    """
+    client = gitdata.GitData(source='a', cache_folder=str(tmpdir))
+    gitdata.metrics_config(state=client)
+    gitdata.trace_event('request', state=client, endpoint='/user/orgs',
+                        page=1, status=200, bytes=100, cache='miss',
+                        seconds=0.3, ratelimit_remaining=4999)
+    gitdata.trace_event('request', state=client, endpoint='/user/orgs',
+                        page=1, status=200, bytes=100, cache='memo',
+                        seconds=0.0, ratelimit_remaining=4999)
+    gitdata.trace_event('projection', state=client, entity='org', records=2,
+                        seconds=0.0)
+
+    lines = gitdata.metrics_text(client).splitlines()
+    assert 'gitdata_cache_hits_total 1' in lines
+    assert 'gitdata_cache_misses_total 1' in lines
+    assert 'gitdata_request_latency_seconds_bucket{le="0.25"} 0' in lines
+    assert 'gitdata_request_latency_seconds_bucket{le="0.5"} 1' in lines
+    assert 'gitdata_request_latency_seconds_bucket{le="+Inf"} 1' in lines
+    assert 'gitdata_request_latency_seconds_count 1' in lines
+    assert 'gitdata_request_latency_seconds_sum 0.3' in lines
+    assert 'gitdata_records_total{entity="org"} 2' in lines
+    assert gitdata._settings.metrics is None
+
+def test_sort_records_external(tmpdir):
+    """Records that don't fit in sort_memory are sorted in runs that are
+    merged, with the same result as an in-memory sort.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    client.sort_memory = 2000
+    records = [{'name': 'repo-{0}'.format(n * 7919 % 250), 'size': n % 7}
+               for n in range(250)]
+
+    runs = gitdata.sort_records(iter(records), '-size,name', state=client)
+    assert isinstance(runs, gitdata.SortedRuns)
+    assert len(runs.runfiles) > 1
+    assert list(runs) == sorted(records,
+                                key=lambda rec: (-rec['size'], rec['name']))
+
+    client.sort_memory = gitdata._settings.sort_memory
+    assert gitdata.sort_records(iter(records), '-size,name', state=client) == \
+        sorted(records, key=lambda rec: (-rec['size'], rec['name']))
+
+def test_cache_prune_evict(monkeypatch, tmpdir):
+    """cache prune removes cache files older than the specified age and old
+    orphaned temporary files, and cache evict removes the least recently used
+    cache files until the cache fits in the quota.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    now = time.time()
+    filenames = []
+    for orgno, age in enumerate([40, 20, 10, 0]):
+        endpoint = '/orgs/org{0}/repos?per_page=100'.format(orgno)
+        gitdata.cache_update(endpoint, [{'name': 'repo', 'id': orgno}], None)
+        filenames.append(gitdata.cache_filename(endpoint))
+        os.utime(filenames[-1], (now - age * 86400, now - age * 86400))
+    orphan = os.path.join(os.path.dirname(filenames[0]), 'x.json.1.tmp')
+    recent = os.path.join(os.path.dirname(filenames[0]), 'y.json.1.tmp')
+    for tempfile in [orphan, recent]:
+        with open(tempfile, 'w') as fhandle:
+            fhandle.write('[]')
+    os.utime(orphan, (now - gitdata.CACHE_ORPHANAGE - 60,) * 2)
+
+    runner = CliRunner()
+    runner.invoke(gitdata.cli, ['cache', 'prune', '--days', '30', '--dryrun'])
+    assert all(os.path.isfile(filename) for filename in filenames)
+    runner.invoke(gitdata.cli, ['cache', 'prune', '--days', '30'])
+    assert [os.path.isfile(filename) for filename in filenames] == \
+        [False, True, True, True]
+    assert not os.path.exists(orphan) and os.path.exists(recent)
+
+    entries, _ = gitdata.cache_entries()
+    quota = entries[filenames[3]]['size'] + entries[filenames[2]]['size']
+    runner.invoke(gitdata.cli, ['cache', 'evict', '-m', str(quota)])
+    assert [os.path.isfile(filename) for filename in filenames] == \
+        [False, False, True, True]
+
+def test_diff_records(tmpdir):
+    """diff_records() returns the records that were added, removed or changed
+    between two snapshots, ignoring changes to fields not compared.
+    """
+    old = [{'id': 1, 'name': 'repo1', 'size': 10},
+           {'id': 2, 'name': 'repo2', 'size': 20},
+           {'id': 3, 'name': 'repo3', 'size': 30}]
+    new = [{'id': 1, 'name': 'repo1', 'size': 11},
+           {'id': 3, 'name': 'repo3-renamed', 'size': 30},
+           {'id': 4, 'name': 'repo4', 'size': 40}]
+    filename = str(tmpdir.join('_anon_orgs-org1-repos.json'))
+    gitdata.snapshot_write(filename, old, 2)
+    gitdata.snapshot_write(filename, new, 2)
+    folder = str(tmpdir.join('_anon_orgs-org1-repos.snapshots'))
+    oldpath, newpath = [os.path.join(folder, snapshot)
+                        for snapshot in gitdata.snapshot_list(folder)]
+
+    changes = [dict(record) for record in gitdata.diff_records(
+        oldpath, newpath, 'repo', ['id', 'name'])]
+    assert changes == [{'change': 'changed', 'id': 3, 'name': 'repo3-renamed'},
+                       {'change': 'added', 'id': 4, 'name': 'repo4'},
+                       {'change': 'removed', 'id': 2, 'name': 'repo2'}]
+
+def test_cache_lookup(tmpdir):
+    """cache_lookup() returns every record with the specified key value,
+    without regard to case, and builds the offset index on first use.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    endpoint = '/orgs/org1/members?per_page=100'
+    gitdata.cache_update(endpoint, [{'login': 'Alice', 'id': 1},
+                                    {'login': 'bob', 'id': 2}],
+                         None, state=client)
+    dbname = os.path.splitext(gitdata.cache_filename(
+        endpoint, None, client))[0] + '.offsets.db'
+    assert not os.path.exists(dbname)
+
+    assert gitdata.cache_lookup(endpoint, state=client, login='alice') == \
+        [{'login': 'Alice', 'id': 1}]
+    assert os.path.exists(dbname)
+    assert [record['login'] for record in
+            gitdata.cache_lookup(endpoint, state=client, id=2)] == ['bob']
+    assert gitdata.cache_lookup(endpoint, state=client, login='carol') == []
+    assert gitdata.cache_lookup('/orgs/org2/members?per_page=100',
+                                state=client, login='alice') == []
+
+    endpoint = '/user/repos?per_page=100'
+    gitdata.cache_update(endpoint, [{'name': 'docs', 'id': 1},
+                                    {'name': 'tools', 'id': 2},
+                                    {'name': 'Docs', 'id': 3}],
+                         None, state=client)
+    assert [record['id'] for record in
+            gitdata.cache_lookup(endpoint, state=client, name='docs')] == \
+        [1, 3]
+
+def test_export_jobs(monkeypatch, tmpdir):
+    """Exporting cached data with --jobs splits the cache file into parts,
+    and writes the same output as a single process.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    monkeypatch.setattr(gitdata, 'EXPORT_CHUNK', 300)
+    gitdata.cache_update('/orgs/org1/repos?per_page=100',
+                         [{'name': 'repo-{0:03d}'.format(n), 'id': n,
+                           'owner': {'login': 'org1'}} for n in range(100)],
+                         None)
+
+    runner = CliRunner()
+    for file_ext in ['.csv', '.json', '.jsonl']:
+        outputs = []
+        for jobs in ['1', '3']:
+            filename = str(tmpdir.join('repos-' + jobs + file_ext))
+            result = runner.invoke(gitdata.cli, [
+                'repos', '-o', 'org1', '-sc', '-d', '-fname/id/owner.login',
+                '-j', jobs, '-n', filename])
+            assert result.exit_code == 0, result.output
+            with open(filename) as fhandle:
+                outputs.append(fhandle.read())
+        assert outputs[0] == outputs[1]
+        assert 'repo-099' in outputs[0]
+
+def test_github_count(monkeypatch, tmpdir):
+    """github_count() gets the number of records from the page number of the
+    rel="last" link, and counts all pages if there's no such link.
+    """
+    client = gitdata.GitData(source='a', cache_folder=str(tmpdir))
+    endpoint = '/orgs/org1/repos?per_page=100'
+    links = {'next': {'url': 'https://api.github.com/x?per_page=1&page=2'},
+             'last': {'url': 'https://api.github.com/x?per_page=1&page=42'}}
+    countpoints = []
+    def github_api(*, endpoint=None, auth=None, headers=None, state=None):
+        countpoints.append(endpoint)
+        return FakeResponse([{'id': 1}], links=links)
+    monkeypatch.setattr(gitdata, 'github_api', github_api)
+    monkeypatch.setattr(gitdata, 'github_allpages',
+                        lambda **kwargs: [{'id': n} for n in range(5)])
+
+    assert gitdata.github_count(endpoint=endpoint, state=client) == 42
+    assert countpoints == ['/orgs/org1/repos?per_page=1']
+
+    del links['last']
+    assert gitdata.github_count(endpoint=endpoint, state=client) == 5
+
+    del links['next']
+    assert gitdata.github_count(endpoint=endpoint, state=client) == 1
+
+def test_serve_errors(monkeypatch, tmpdir):
+    """The serve command's handler returns a JSON error with HTTP status 500
+    for errors other than failed API calls, and each request thread has its
+    own requests session.
+    """
+    client = gitdata.ServeClient(cache_folder=str(tmpdir))
+    def github_records(**kwargs):
+        raise gitdata.IncompleteData('page limit reached')
+        yield # pylint: disable=W0101
+    monkeypatch.setattr(gitdata, 'github_records', github_records)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), gitdata.ServeHandler)
+    server.client = client
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = 'http://127.0.0.1:{0}/repos?org=org1'.format(
+            server.server_address[1])
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(url)
+        assert excinfo.value.code == 500
+        assert json.load(excinfo.value) == \
+            {'error': 'IncompleteData: page limit reached'}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    sessions = []
+    def getsession():
+        gitdata.session_config(state=client)
+        sessions.append(client.requests_session)
+    thread = threading.Thread(target=getsession)
+    thread.start()
+    thread.join()
+    getsession()
+    assert sessions[0] is not sessions[1]
+
+def test_repos_incremental(monkeypatch, tmpdir):
+    """repos --incremental gets the repos updated since the cached data, and
+    merges them into the cached data by id.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    endpoint = '/orgs/org1/repos?per_page=100'
+    gitdata.cache_update(endpoint, [
+        {'id': 1, 'name': 'repo1', 'updated_at': '2020-01-01T00:00:00Z'},
+        {'id': 2, 'name': 'repo2', 'updated_at': '2020-02-01T00:00:00Z'},
+        {'id': 3, 'name': 'repo3', 'updated_at': '2020-03-01T00:00:00Z'}],
+                         None)
+    endpoints = []
+    def github_api(*, endpoint=None, auth=None, headers=None, state=None):
+        endpoints.append(endpoint)
+        return FakeResponse([
+            {'id': 4, 'name': 'repo4', 'updated_at': '2020-05-01T00:00:00Z'},
+            {'id': 2, 'name': 'repo2-renamed',
+             'updated_at': '2020-04-01T00:00:00Z'},
+            {'id': 3, 'name': 'repo3', 'updated_at': '2020-03-01T00:00:00Z'},
+            {'id': 1, 'name': 'repo1', 'updated_at': '2020-01-01T00:00:00Z',
+             'pushed_at': '2020-06-01T00:00:00Z'}],
+                            links={'next': {'url': endpoint + '&page=2'}})
+    monkeypatch.setattr(gitdata, 'github_api', github_api)
+
+    runner = CliRunner()
+    result = runner.invoke(gitdata.cli, ['repos', '-o', 'org1', '-sc',
+                                         '--incremental', '-d'])
+    assert 'ERROR: --incremental requires -sa' in result.output
+    assert not endpoints
+
+    filename = str(tmpdir.join('repos.json'))
+    result = runner.invoke(gitdata.cli, ['repos', '-o', 'org1', '-d',
+                                         '--incremental', '-fid/name',
+                                         '-n', filename])
+    assert result.exit_code == 0, result.output
+    assert endpoints == [endpoint + '&sort=updated&direction=desc']
+    assert [(repo['id'], repo['name'])
+            for repo in gitdata.read_json(gitdata.cache_filename(endpoint))] \
+        == [(1, 'repo1'), (2, 'repo2-renamed'), (3, 'repo3'), (4, 'repo4')]
+    with open(filename) as fhandle:
+        assert [repo['name'] for repo in json.load(fhandle)] == \
+            ['repo1', 'repo2-renamed', 'repo3', 'repo4']
+
+def test_warm_dryrun(monkeypatch, tmpdir):
+    """warm --dryrun displays the refresh plan without calling the API.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    def github_api(**kwargs):
+        raise AssertionError('API called: ' + kwargs['endpoint'])
+    monkeypatch.setattr(gitdata, 'github_api', github_api)
+    manifest = tmpdir.join('manifest.txt')
+    manifest.write('repos -o org1\n/orgs/org1/teams?per_page=100\n')
+
+    result = CliRunner().invoke(gitdata.cli, ['warm', str(manifest),
+                                              '--dryrun'])
+    assert result.exit_code == 0, result.output
+    assert '/orgs/org1/repos?per_page=100' in result.output
+    assert '/orgs/org1/teams?per_page=100' in result.output
+
+def test_usage_log_size(monkeypatch, tmpdir):
+    """The usage log is pruned when it grows larger than USAGE_MAXSIZE, and
+    the most recent entries are kept.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    monkeypatch.setattr(gitdata, 'USAGE_MAXSIZE', 2000)
+    for orgno in range(100):
+        gitdata.usage_record('/orgs/org{0}/repos'.format(orgno), state=client)
+
+    assert os.path.getsize(gitdata.usage_logfile(client)) <= 2000
+    reads, _ = gitdata.usage_counts(state=client)
+    assert reads['_anon_orgs-org99-repos.json'] == 1
+    assert reads['_anon_orgs-org0-repos.json'] == 0
+
+def test_commits_all_repos(monkeypatch, tmpdir):
+    """commits -r * reads each repo's commits in a worker thread with its own
+    settings object, and both displays and writes them if -n is specified.
+    """
+    monkeypatch.setattr(gitdata._settings, 'cache_folder', str(tmpdir))
+    gitdata.cache_update('/orgs/org1/repos?per_page=100',
+                         [{'name': 'repo1'}, {'name': 'repo2'}], None)
+    for repo in ['repo1', 'repo2']:
+        gitdata.cache_update(
+            '/repos/org1/' + repo + '/commits?per_page=100',
+            [{'sha': repo + '-sha'}], {'owner': 'org1', 'repo': repo})
+    states = []
+    github_data = gitdata.github_data
+    def spy(**kwargs):
+        states.append(kwargs.get('state'))
+        return github_data(**kwargs)
+    monkeypatch.setattr(gitdata, 'github_data', spy)
+
+    filename = str(tmpdir.join('commits.csv'))
+    result = CliRunner().invoke(gitdata.cli, ['commits', '-o', 'org1', '-r',
+                                              '*', '-sc', '-fsha/repo',
+                                              '-n', filename])
+    assert result.exit_code == 0, result.output
+    assert 'repo1-sha,repo1' in result.output
+    assert 'repo2-sha,repo2' in result.output
+    with open(filename, newline='') as fhandle:
+        assert sorted(csv.reader(fhandle)) == \
+            [['repo1-sha', 'repo1'], ['repo2-sha', 'repo2'], ['sha', 'repo']]
+    assert len(states) == 3 # the repo list, and the commits for each repo
+    assert all(isinstance(state, gitdata.ThreadSettings)
+               for state in states[1:])
+
+def test_cache_file_permissions(tmpdir):
+    """Cache files get the permissions of a file created with open(), and no
+    temporary files are left in the cache folder.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    umask = os.umask(0o027)
+    try:
+        gitdata.cache_update('/orgs/org1/repos', [{'name': 'repo'}], None,
+                             state=client)
+    finally:
+        os.umask(umask)
+    filename = gitdata.cache_filename('/orgs/org1/repos', state=client)
+    assert os.stat(filename).st_mode & 0o777 == 0o640
+    assert not [name for _, _, names in os.walk(str(tmpdir))
+                for name in names if name.endswith('.tmp')]
+
+def test_query_columns(tmpdir):
+    """Queries use the columnar index, which is replaced (not updated in
+    place) when the cache file changes, and fall back to the cache data for
+    shorthand field lists and fields that aren't in the index.
+    """
+    client = gitdata.GitData(source='c', cache_folder=str(tmpdir))
+    endpoint = '/orgs/org1/repos'
+    gitdata.cache_update(endpoint, [
+        {'id': 1, 'name': 'repo1', 'size': 10, 'owner': {'login': 'org1'}},
+        {'id': 2, 'name': 'repo2', 'size': 20, 'owner': {'login': 'org1'}}],
+                         None, state=client)
+    filename = gitdata.cache_filename(endpoint, state=client)
+    predicates = [gitdata.query_predicate('size>15')]
+
+    assert [dict(row) for row in gitdata.query_cachefile(
+        filename, predicates, ['name', 'owner.login'], 'repo')] == \
+        [{'name': 'repo2', 'owner_login': 'org1'}]
+    assert [dict(row) for row in gitdata.query_cachefile(
+        filename, predicates, ['name', 'owner'], 'repo')] == \
+        [{'name': 'repo2', 'owner': {'login': 'org1'}}]
+    assert [row['id'] for row in gitdata.query_cachefile(
+        filename, predicates, ['*'], 'repo')] == [2]
+
+    gitdata.cache_update(endpoint, [{'id': 3, 'name': 'repo3', 'size': 30}],
+                         None, state=client)
+    assert [dict(row) for row in gitdata.query_cachefile(
+        filename, predicates, ['name'], 'repo')] == [{'name': 'repo3'}]
+    assert not [name for name in os.listdir(os.path.dirname(filename))
+                if name.endswith('.tmp')]